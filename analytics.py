@@ -0,0 +1,252 @@
+import asyncio
+import contextlib
+import datetime
+import gzip
+import json
+import logging
+import os
+import sqlite3
+from collections import Counter, defaultdict
+from types import MappingProxyType
+
+from dotenv import load_dotenv
+
+from city_index import city_index
+from database import run_db
+from utils import normalize_city
+
+load_dotenv()
+
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "60"))
+QUERY_LOG_KEEP_DAYS = int(os.getenv("QUERY_LOG_KEEP_DAYS", "30"))  # сырые логи старше уходят в архив
+QUERY_LOG_ARCHIVE_DIR = os.getenv("QUERY_LOG_ARCHIVE_DIR", "archive")
+ROLLUP_BATCH = 10000
+ARCHIVE_BATCH = 5000
+
+SQL_STATE_GET = "SELECT value FROM rollup_state WHERE name = ?"
+SQL_STATE_SET = "INSERT OR REPLACE INTO rollup_state (name, value) VALUES (?, ?)"
+SQL_LOGS_AFTER = "SELECT id, user_id, query, datetime FROM query_logs WHERE id > ? ORDER BY id LIMIT ?"
+SQL_HOURLY_ADD = """
+    INSERT INTO query_rollup_hourly (hour, city, queries) VALUES (?, ?, ?)
+    ON CONFLICT(hour, city) DO UPDATE SET queries = queries + excluded.queries
+"""
+SQL_DAILY_ADD = """
+    INSERT INTO query_rollup_daily (day, city, queries) VALUES (?, ?, ?)
+    ON CONFLICT(day, city) DO UPDATE SET queries = queries + excluded.queries
+"""
+SQL_USER_ADD = """
+    INSERT INTO user_rollup_daily (day, user_id, queries) VALUES (?, ?, ?)
+    ON CONFLICT(day, user_id) DO UPDATE SET queries = queries + excluded.queries
+"""
+SQL_ARCHIVE_SELECT = """
+    SELECT id, user_id, query, datetime FROM query_logs
+    WHERE id <= ? AND datetime < ? ORDER BY id LIMIT ?
+"""
+SQL_ARCHIVE_DELETE = "DELETE FROM query_logs WHERE id <= ? AND datetime < ?"
+SQL_HOURLY_PRUNE = "DELETE FROM query_rollup_hourly WHERE hour < ?"
+
+SQL_TOP_CITIES = """
+    SELECT city, SUM(queries) AS total FROM query_rollup_daily
+    WHERE day >= ? GROUP BY city ORDER BY total DESC LIMIT ?
+"""
+SQL_TOP_CITIES_HOURLY = """
+    SELECT city, SUM(queries) AS total FROM query_rollup_hourly
+    WHERE hour >= ? GROUP BY city ORDER BY total DESC LIMIT ?
+"""
+SQL_DAY_USERS = "SELECT COUNT(*), COALESCE(SUM(queries), 0) FROM user_rollup_daily WHERE day = ?"
+SQL_TOP_USERS = """
+    SELECT user_id, SUM(queries) AS total FROM user_rollup_daily
+    WHERE day >= ? GROUP BY user_id ORDER BY total DESC LIMIT ?
+"""
+SQL_NEW_USERS = "SELECT COUNT(*) FROM users WHERE reg_datetime >= ?"
+SQL_TOTAL_USERS = "SELECT COUNT(*) FROM users"
+
+LAST_ID = "query_logs_last_id"
+
+
+def _state(conn: sqlite3.Connection, name: str) -> int:
+    row = conn.execute(SQL_STATE_GET, (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def _query_cities(query: str | None, aliases: MappingProxyType) -> set[str]:
+    """Официальные названия городов из текста запроса (через запятую)."""
+    cities = set()
+    for part in (query or "").split(","):
+        official = aliases.get(normalize_city(part))
+        if official:
+            cities.add(official)
+    return cities
+
+
+def _rollup_batch(conn: sqlite3.Connection, aliases: MappingProxyType) -> int:
+    """
+    Добавление в агрегаты следующей пачки логов. Чтение last_id и строк,
+    агрегаты и новый last_id — в одной транзакции с блокировкой на запись:
+    каждая строка учитывается ровно один раз, даже если агрегацию
+    запускают несколько процессов.
+    """
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        last_id = _state(conn, LAST_ID)
+        rows = conn.execute(SQL_LOGS_AFTER, (last_id, ROLLUP_BATCH)).fetchall()
+        if not rows:
+            return 0
+        hourly = Counter()
+        daily = Counter()
+        users = Counter()
+        for _id, user_id, query, logged_at in rows:
+            logged_at = str(logged_at)
+            hour, day = logged_at[:13], logged_at[:10]
+            users[day, user_id] += 1
+            for city in _query_cities(query, aliases):
+                hourly[hour, city] += 1
+                daily[day, city] += 1
+        conn.executemany(SQL_HOURLY_ADD, [(*key, n) for key, n in hourly.items()])
+        conn.executemany(SQL_DAILY_ADD, [(*key, n) for key, n in daily.items()])
+        conn.executemany(SQL_USER_ADD, [(*key, n) for key, n in users.items()])
+        conn.execute(SQL_STATE_SET, (LAST_ID, rows[-1][0]))
+    return len(rows)
+
+
+def _archive_batch(conn: sqlite3.Connection, before: str, directory: str) -> int:
+    """
+    Пачка старых строк: запись в архив и удаление под одной блокировкой
+    на запись, чтобы другой процесс не заархивировал те же строки.
+    В архив уходят только строки, уже учтённые в агрегатах.
+    """
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(SQL_ARCHIVE_SELECT, (_state(conn, LAST_ID), before, ARCHIVE_BATCH)).fetchall()
+        if not rows:
+            return 0
+        _write_archive(rows, directory)
+        return conn.execute(SQL_ARCHIVE_DELETE, (rows[-1][0], before)).rowcount
+
+
+def _write_archive(rows: list[tuple], directory: str):
+    """Дописывание строк в gzip-файлы JSON Lines по дням (query_logs-ГГГГ-ММ-ДД.jsonl.gz)."""
+    os.makedirs(directory, exist_ok=True)
+    by_day = defaultdict(list)
+    for row_id, user_id, query, logged_at in rows:
+        logged_at = str(logged_at)
+        by_day[logged_at[:10]].append({"id": row_id, "user_id": user_id, "query": query, "datetime": logged_at})
+    for day, items in by_day.items():
+        path = os.path.join(directory, f"query_logs-{day}.jsonl.gz")
+        # каждая дозапись — отдельный gzip-член, gzip/zcat читают файл целиком
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.writelines(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _top_cities(conn: sqlite3.Connection, since_day: str, limit: int) -> list[tuple[str, int]]:
+    return conn.execute(SQL_TOP_CITIES, (since_day, limit)).fetchall()
+
+
+def _top_cities_hourly(conn: sqlite3.Connection, since_hour: str, limit: int) -> list[tuple[str, int]]:
+    return conn.execute(SQL_TOP_CITIES_HOURLY, (since_hour, limit)).fetchall()
+
+
+def _summary(conn: sqlite3.Connection, day: str, week_ago: str) -> dict:
+    active, queries = conn.execute(SQL_DAY_USERS, (day,)).fetchone()
+    return {
+        "queries": queries,
+        "active_users": active,
+        "new_users": conn.execute(SQL_NEW_USERS, (day,)).fetchone()[0],
+        "total_users": conn.execute(SQL_TOTAL_USERS).fetchone()[0],
+        "top_today": _top_cities(conn, day, 10),
+        "top_week": _top_cities(conn, week_ago, 10),
+        "top_users_week": conn.execute(SQL_TOP_USERS, (week_ago, 5)).fetchall(),
+    }
+
+
+def _prune_hourly(conn: sqlite3.Connection, before_hour: str) -> int:
+    with conn:
+        return conn.execute(SQL_HOURLY_PRUNE, (before_hour,)).rowcount
+
+
+class QueryRollup:
+    """
+    Инкрементальные агрегаты query_logs по часам и дням.
+    Раз в ROLLUP_INTERVAL секунд обрабатываются строки с id больше
+    последнего учтённого, текст запроса разбирается на города через
+    индекс алиасов. Сырые строки старше QUERY_LOG_KEEP_DAYS дней
+    пачками переносятся в gzip-архивы и удаляются из БД (запись в архив
+    до фиксации удаления: при сбое строка может попасть в архив дважды,
+    но не пропасть). Архив пишется в потоке БД: пачка небольшая, а другие
+    процессы не должны вклиниться между записью файла и удалением строк.
+    Почасовые агрегаты хранятся столько же, дневные — бессрочно.
+    """
+
+    def __init__(self, interval: float = ROLLUP_INTERVAL):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+        self.processed = 0
+        self.archived = 0
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.process()
+                await self.archive()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка агрегации логов запросов: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    async def process(self) -> int:
+        """Учёт всех новых строк query_logs."""
+        async with self._lock:
+            total = 0
+            while True:
+                count = await run_db(_rollup_batch, city_index.aliases)
+                total += count
+                if count < ROLLUP_BATCH:
+                    break
+            self.processed += total
+            return total
+
+    async def archive(self) -> int:
+        """Перенос старых сырых строк в архивные файлы."""
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=QUERY_LOG_KEEP_DAYS)
+        before = str(cutoff)
+        total = 0
+        async with self._lock:
+            while count := await run_db(_archive_batch, before, QUERY_LOG_ARCHIVE_DIR):
+                total += count
+            if total:
+                await run_db(_prune_hourly, before[:13])
+                logging.info("В архив перенесено %s строк query_logs", total)
+        self.archived += total
+        return total
+
+    async def summary(self) -> dict:
+        """Сводка для админа: сегодня и последние 7 дней (только по агрегатам)."""
+        await self.process()
+        today = datetime.date.today()
+        return await run_db(_summary, today.isoformat(), (today - datetime.timedelta(days=6)).isoformat())
+
+    async def top_cities(self, hours: float, limit: int) -> list[tuple[str, int]]:
+        """Самые запрашиваемые города за последние hours часов."""
+        since = datetime.datetime.now() - datetime.timedelta(hours=hours)
+        return await run_db(_top_cities_hourly, str(since)[:13], limit)
+
+    def stats(self) -> dict:
+        return {"processed": self.processed, "archived": self.archived}
+
+
+query_rollup = QueryRollup()
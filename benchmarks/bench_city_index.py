@@ -0,0 +1,87 @@
+"""
+Индекс алиасов на таблице citys со 100k алиасов:
+полная сборка, инкрементальное обновление и поиск против
+старой пересборки словаря на каждый запрос.
+
+    python benchmarks/bench_city_index.py [кол-во алиасов]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from city_index import CityIndex  # noqa: E402
+
+ALIASES_PER_CITY = 4
+
+
+def fill(conn, n_aliases: int):
+    rows = []
+    for i in range(n_aliases // ALIASES_PER_CITY):
+        aliases = ", ".join(f"город{i}-{j}" for j in range(ALIASES_PER_CITY - 1))
+        rows.append((f"Город{i}", aliases))
+    with conn:
+        conn.executemany("INSERT INTO citys (name, aliases) VALUES (?, ?)", rows)
+
+
+def touch(conn, n: int):
+    with conn:
+        conn.execute("UPDATE citys SET aliases = aliases || ', новый' || id WHERE id <= ?", (n,))
+
+
+def legacy_lookup(conn, city_list):
+    rows = conn.execute("SELECT name, aliases FROM citys").fetchall()
+    aliases_map = {}
+    for db_name, db_aliases in rows:
+        variants = [v.strip().lower() for v in (db_aliases or "").split(',')]
+        variants.append(db_name.lower())
+        for v in variants:
+            aliases_map[v] = db_name
+    return [aliases_map.get(c.lower()) for c in city_list]
+
+
+async def run(n_aliases: int):
+    await database.run_db(fill, n_aliases)
+    index = CityIndex(refresh_interval=0)
+
+    start = time.perf_counter()
+    await index.load()
+    print(f"full build:          {(time.perf_counter() - start) * 1000:8.1f} ms ({len(index)} aliases)")
+
+    await database.run_db(touch, 100)
+    start = time.perf_counter()
+    await index.refresh()
+    print(f"refresh (100 rows):  {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    start = time.perf_counter()
+    await index.refresh()
+    print(f"refresh (no change): {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    queries = ["Город1", " ГОРОД2-1 ", "неизвестно"] * 10000
+    start = time.perf_counter()
+    for q in queries:
+        index.lookup(q)
+    per_lookup = (time.perf_counter() - start) / len(queries) * 1e6
+    print(f"lookup:              {per_lookup:8.2f} us")
+
+    start = time.perf_counter()
+    await database.run_db(legacy_lookup, ["Город1", "Город2-1"])
+    print(f"legacy per message:  {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    await database.close_db()
+
+
+def main():
+    n_aliases = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, "bench.db")
+        database.create_tables()
+        asyncio.run(run(n_aliases))
+
+
+if __name__ == "__main__":
+    main()
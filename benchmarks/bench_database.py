@@ -0,0 +1,70 @@
+"""
+Сравнение пропускной способности записи логов:
+старый вариант (sqlite3.connect на каждый вызов), прямая запись через поток БД
+и пакетная запись через очередь write-behind.
+
+    python benchmarks/bench_database.py [кол-во сообщений]
+"""
+import asyncio
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def legacy_log_query(db_name: str, user_id: int, text: str):
+    conn = sqlite3.connect(db_name)
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO query_logs (user_id, query, datetime) VALUES (?, ?, ?)",
+        (user_id, text, datetime.datetime.now())
+    )
+    conn.commit()
+    conn.close()
+
+
+async def bench_legacy(db_name: str, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        legacy_log_query(db_name, i % 100, "Москва, Пермь")
+        await asyncio.sleep(0)
+    return n / (time.perf_counter() - start)
+
+
+async def bench_async(n: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(database.log_query(i % 100, "Москва, Пермь") for i in range(n)))
+    return n / (time.perf_counter() - start)
+
+
+async def bench_write_behind(n: int) -> float:
+    database.write_queue.start()
+    start = time.perf_counter()
+    for i in range(n):
+        await database.log_query(i % 100, "Москва, Пермь")
+    await database.write_queue.stop()
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, "bench.db")
+        database.create_tables()
+        legacy = asyncio.run(bench_legacy(database.DB_NAME, n))
+        current = asyncio.run(bench_async(n))
+        batched = asyncio.run(bench_write_behind(n))
+        asyncio.run(database.close_db())
+    print(f"per-call connect: {legacy:10.0f} msg/s")
+    print(f"pooled async:     {current:10.0f} msg/s")
+    print(f"write-behind:     {batched:10.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Рассылка одного слота подписок: постановка в очередь и отправка через
+заглушки Bot API и OWM (без сети). Показывает предел самого движка —
+в бою скорость ограничивает DELIVERY_RATE (лимит Telegram).
+
+    python benchmarks/bench_delivery.py [подписчиков] [городов]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+database.DB_NAME = os.path.join(tempfile.mkdtemp(), "bench_delivery.db")
+
+import delivery  # noqa: E402
+from weather_model import Weather  # noqa: E402
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+
+
+async def fake_weather_many(city_names, priority=None):
+    await asyncio.sleep(0.05)  # один /group-запрос на пачку
+    return [Weather(status=200, name=city, temp=1.0) for city in city_names]
+
+
+def fill(conn, subscribers: int, cities: int, slot: int):
+    rows = [
+        (user_id, f"Город {int(random.paretovariate(1.2)) % cities}", "08:00", 0, slot, None)
+        for user_id in range(subscribers)
+    ]
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO subscriptions (user_id, city, send_time, utc_offset, slot, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+
+async def main():
+    subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    cities = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    at = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    database.create_tables()
+    await database.run_db(fill, subscribers, cities, at.hour * 60 + at.minute)
+
+    delivery.get_weather_many = fake_weather_many
+    bot = FakeBot()
+    scheduler = delivery.DeliveryScheduler(bot, rate=1e9, workers=32)
+    scheduler._tasks = [asyncio.create_task(scheduler._send_worker()) for _ in range(scheduler.workers)]
+
+    started = time.perf_counter()
+    messages = await scheduler.process_slot(at)
+    queued = time.perf_counter() - started
+    await scheduler._queue.join()
+    total = time.perf_counter() - started
+    await scheduler.stop()
+
+    again = await scheduler.process_slot(at)
+    print(f"subscribers: {subscribers}, messages: {messages}, sent: {bot.sent}")
+    print(f"queued in:   {queued:6.2f} s")
+    print(f"sent in:     {total:6.2f} s  ({bot.sent / total:,.0f} msg/s)")
+    print(f"re-run:      {again} messages (already delivered)")
+    await database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
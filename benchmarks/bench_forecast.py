@@ -0,0 +1,36 @@
+"""
+Сводка прогноза по дням: пачкой (aggregate_many, один набор операций NumPy)
+и по одному городу (aggregate) на синтетических ответах /forecast.
+
+    python benchmarks/bench_forecast.py [кол-во городов]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import _owm_forecast  # noqa: E402
+from forecast import aggregate, aggregate_many  # noqa: E402
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    responses = [_owm_forecast(f"City {i}", i) for i in range(n)]
+
+    start = time.perf_counter()
+    batch = aggregate_many(responses)
+    batch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = [aggregate(r) for r in responses]
+    single_time = time.perf_counter() - start
+
+    assert [f.days for f in batch] == [f.days for f in single]
+    print(f"cities: {n}, steps: {n * 40}")
+    print(f"aggregate_many: {batch_time * 1e3:8.1f} ms ({batch_time / n * 1e6:6.1f} us/city)")
+    print(f"aggregate:      {single_time * 1e3:8.1f} ms ({single_time / n * 1e6:6.1f} us/city)")
+
+
+if __name__ == "__main__":
+    main()
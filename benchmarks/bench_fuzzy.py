@@ -0,0 +1,58 @@
+"""
+Нечёткий поиск городов: время сборки триграммного индекса и задержка
+поиска с опечатками на 100k+ алиасов. Цель — p99 поиска до 10 мс.
+
+    python benchmarks/bench_fuzzy.py [кол-во алиасов]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzy import FuzzyMatcher  # noqa: E402
+
+ALPHABET = "абвгдежзийклмнопрстуфхцчшщыэюя"
+
+
+def random_name(rnd: random.Random) -> str:
+    return "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(5, 12)))
+
+
+def typo(rnd: random.Random, word: str) -> str:
+    i = rnd.randrange(len(word))
+    return word[:i] + rnd.choice(ALPHABET) + word[i + 1:]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rnd = random.Random(42)
+    aliases = {}
+    while len(aliases) < n:
+        name = random_name(rnd)
+        aliases[name] = name.capitalize()
+
+    start = time.perf_counter()
+    matcher = FuzzyMatcher(aliases)
+    print(f"build:   {(time.perf_counter() - start) * 1000:8.1f} ms ({len(matcher)} aliases)")
+
+    keys = list(aliases)
+    samples = []
+    hits = 0
+    for _ in range(2000):
+        word = rnd.choice(keys)
+        query = typo(rnd, word)
+        start = time.perf_counter()
+        official, _variants = matcher.correct(query)
+        samples.append((time.perf_counter() - start) * 1000)
+        hits += official == aliases[word]
+    samples.sort()
+    print(f"p50:     {statistics.median(samples):8.2f} ms")
+    print(f"p99:     {samples[int(len(samples) * 0.99)]:8.2f} ms")
+    print(f"fixed:   {hits / len(samples):8.1%}")
+
+
+if __name__ == "__main__":
+    main()
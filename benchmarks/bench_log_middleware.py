@@ -0,0 +1,76 @@
+"""
+Накладные расходы LoggingMiddleware на одно обновление
+(лог-бот подменён заглушкой, обработчик ничего не делает).
+
+    python benchmarks/bench_log_middleware.py [кол-во обновлений]
+"""
+import asyncio
+import datetime
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("ADMIN", "1")
+os.environ["LOG_BATCH_INTERVAL"] = "0.05"
+
+from aiogram.types import Chat, Message, Update, User  # noqa: E402
+
+from logging_setup import setup_logging  # noqa: E402
+from middlewares.log_middleware import LoggingMiddleware  # noqa: E402
+
+
+class FakeSession:
+    async def close(self):
+        pass
+
+
+class FakeLogBot:
+    session = FakeSession()
+
+    async def send_message(self, chat_id, text, parse_mode):
+        pass
+
+
+async def handler(event, data):
+    return None
+
+
+def make_updates(n: int) -> list[Update]:
+    user = User(id=42, is_bot=False, first_name="Тест", username="test")
+    chat = Chat(id=42, type="private")
+    now = datetime.datetime.now()
+    return [
+        Update(update_id=i, message=Message(message_id=i, date=now, chat=chat, from_user=user, text="Москва, Пермь"))
+        for i in range(n)
+    ]
+
+
+async def measure(middleware: LoggingMiddleware, updates: list[Update]) -> float:
+    start = time.perf_counter()
+    for update in updates:
+        await middleware(handler, update, {})
+    elapsed = time.perf_counter() - start
+    await middleware.stop()
+    return elapsed / len(updates) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    updates = make_updates(n)
+    listener = setup_logging()
+    LoggingMiddleware._log_bot = FakeLogBot()
+    for level in (logging.INFO, logging.DEBUG):
+        logging.getLogger().setLevel(level)
+        # в очереди должно поместиться всё, иначе меряем отбрасывание
+        middleware = LoggingMiddleware(None)
+        middleware._queue = asyncio.Queue(n)
+        per_update = asyncio.run(measure(middleware, updates))
+        print(f"{logging.getLevelName(level):5}: {per_update:6.2f} us/update")
+    listener.stop()
+
+
+if __name__ == "__main__":
+    main()
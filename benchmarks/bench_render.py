@@ -0,0 +1,38 @@
+"""
+Стоимость текста подробной погоды: первый рендер и повторный (из кэша
+рендеров) для одних и тех же данных; для сравнения — метка кнопки.
+
+    python benchmarks/bench_render.py [кол-во повторов]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from render import _render_details, format_detailed_weather, format_weather_label  # noqa: E402
+from weather_model import Weather  # noqa: E402
+
+SAMPLE = Weather(
+    status=200, name="Москва", id=524901, temp=12.34, feels_like=11.5, humidity=71, pressure=1012,
+    wind_speed=4.12, wind_deg=230, clouds=100, description="пасмурно", visibility=10000,
+    sunrise=1759980000, sunset=1760020000, timezone=10800, fetched_at=time.time(),
+)
+
+
+def per_call(func, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        func("Москва", SAMPLE)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"details render: {per_call(_render_details, n):6.2f} us")
+    print(f"details cached: {per_call(format_detailed_weather, n):6.2f} us")
+    print(f"label render:   {per_call(format_weather_label, n):6.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Ответ OWM как dict против Weather: время разбора и память на город в кэше.
+
+    python benchmarks/bench_weather_model.py [кол-во городов]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from weather_model import Weather, json_loads  # noqa: E402
+
+# типичный ответ /weather
+SAMPLE = {
+    "coord": {"lon": 37.6156, "lat": 55.7522},
+    "weather": [{"id": 804, "main": "Clouds", "description": "пасмурно", "icon": "04d"}],
+    "base": "stations",
+    "main": {
+        "temp": 12.34, "feels_like": 11.5, "temp_min": 11.2, "temp_max": 13.1,
+        "pressure": 1012, "humidity": 71, "sea_level": 1012, "grnd_level": 993,
+    },
+    "visibility": 10000,
+    "wind": {"speed": 4.12, "deg": 230, "gust": 7.3},
+    "clouds": {"all": 100},
+    "dt": 1760000000,
+    "sys": {"type": 2, "id": 2000314, "country": "RU", "sunrise": 1759980000, "sunset": 1760020000},
+    "timezone": 10800,
+    "id": 524901,
+    "name": "Москва",
+    "cod": 200,
+}
+
+
+def measure_parse(raw: bytes, n: int):
+    start = time.perf_counter()
+    for _ in range(n):
+        json.loads(raw)
+    as_dict = (time.perf_counter() - start) / n * 1e6
+
+    start = time.perf_counter()
+    for _ in range(n):
+        Weather.from_owm(json_loads(raw))
+    as_model = (time.perf_counter() - start) / n * 1e6
+    return as_dict, as_model
+
+
+def measure_memory(factory, n: int) -> float:
+    tracemalloc.start()
+    items = [factory(i) for i in range(n)]
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return size / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    raw = json.dumps(SAMPLE, ensure_ascii=False).encode()
+    weather = Weather.from_owm(SAMPLE)
+    blob = weather.to_bytes()
+    assert Weather.from_bytes(blob) == weather
+
+    as_dict, as_model = measure_parse(raw, n)
+    print(f"decoder:          {json_loads.__module__}")
+    print(f"parse dict:       {as_dict:6.2f} us")
+    print(f"parse Weather:    {as_model:6.2f} us")
+
+    start = time.perf_counter()
+    for _ in range(n):
+        Weather.from_bytes(blob)
+    print(f"from_bytes:       {(time.perf_counter() - start) / n * 1e6:6.2f} us")
+
+    print(f"json size:        {len(raw):6d} B")
+    print(f"binary size:      {len(blob):6d} B")
+    # память на город: каждый элемент разбирается заново, как в кэше
+    print(f"memory dict:      {measure_memory(lambda i: json.loads(raw), n):6.0f} B/city")
+    print(f"memory Weather:   {measure_memory(lambda i: Weather.from_bytes(blob), n):6.0f} B/city")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Сквозной нагрузочный тест бота на локальных заглушках Telegram Bot API и OWM
+(benchmarks/stubs.py, запускаются отдельным процессом). Бот собирается как
+в main.py — те же middleware, хранилище FSM, фоновые задачи — и получает
+поток обновлений с заданной частотой: сессии пользователей /start, меню,
+список городов (с опечатками и несуществующими городами), листание страниц,
+подробная погода и прогноз, возврат в меню; часть сессий — набор inline-запроса
+по символам.
+
+Отчёт: пропускная способность, p50/p95/p99 по обработчикам, запросы
+к OWM и Bot API на одно обновление, рост RSS. Результат сравнивается
+с базовым из benchmarks/baselines/e2e_load.json (для того же профиля
+нагрузки); ухудшение больше --tolerance — код выхода 1. Базовые значения
+зависят от машины: сохраняются на той, где потом сравниваются.
+
+    python benchmarks/e2e_load.py --rate 50 --duration 60 --owm-latency 0.1 --owm-429 0.01
+    python benchmarks/e2e_load.py --rate 50 --duration 60 --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import aiohttp  # noqa: E402
+
+from stubs import add_fault_arguments, owm_city_id, stub_arguments  # noqa: E402
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "e2e_load.json")
+MENU_CITIES = "🌡 Посмотреть температуру городов"
+ITEMS_PER_PAGE = 4
+CITIES = [
+    "Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург", "Казань", "Нижний Новгород",
+    "Челябинск", "Самара", "Омск", "Ростов-на-Дону", "Уфа", "Красноярск", "Воронеж", "Пермь",
+    "Волгоград", "Краснодар", "Саратов", "Тюмень", "Тольятти", "Ижевск", "Барнаул", "Ульяновск",
+    "Иркутск", "Хабаровск", "Ярославль", "Владивосток", "Махачкала", "Томск", "Оренбург",
+    "Кемерово", "Новокузнецк", "Рязань", "Астрахань", "Набережные Челны", "Пенза", "Липецк",
+    "Киров", "Чебоксары", "Тула", "Калининград", "Курск", "Ставрополь", "Сочи", "Тверь",
+    "Магнитогорск", "Иваново", "Брянск", "Белгород", "Сургут", "Владимир", "Волжский", "Архангельск",
+]
+# частота запросов города убывает по закону Ципфа
+CITY_WEIGHTS = [1 / (i + 1) for i in range(len(CITIES))]
+TYPO_RATE = 0.05
+UNKNOWN_RATE = 0.03
+INLINE_SHARE = 0.3  # доля сессий в inline-режиме (@бот Моск в другом чате)
+KEYSTROKE = 0.15  # средняя пауза между символами inline-запроса, с
+FORECAST_SHARE = 0.3  # доля открытий подробной погоды, после которых смотрят прогноз
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))] if sorted_values else 0.0
+
+
+def typo(rng: random.Random, city: str) -> str:
+    i = rng.randrange(1, len(city))
+    return city[:i] + city[i + 1:]
+
+
+def inline_script(rng: random.Random) -> list[tuple[str, str, str]]:
+    """Набор названия города по символам: каждый символ — отдельный inline-запрос."""
+    city = rng.choices(CITIES, CITY_WEIGHTS)[0]
+    return [("inline_weather", "inline", city[:i]) for i in range(1, rng.randint(3, len(city)) + 1)]
+
+
+def session_script(rng: random.Random) -> list[tuple[str, str, str]]:
+    """Шаги одной сессии: (обработчик, вид обновления, текст или callback_data)."""
+    if rng.random() < INLINE_SHARE:
+        return inline_script(rng)
+    cities = list(dict.fromkeys(rng.choices(CITIES, CITY_WEIGHTS, k=rng.randint(1, 10))))
+    typed = []
+    for city in cities:
+        roll = rng.random()
+        if roll < UNKNOWN_RATE:
+            typed.append(f"Xyz{city}")
+        elif roll < UNKNOWN_RATE + TYPO_RATE:
+            typed.append(typo(rng, city))
+        else:
+            typed.append(city)
+    steps = [
+        ("cmd_start", "message", "/start"),
+        ("handle_view_cities", "message", MENU_CITIES),
+        ("process_city_list", "message", ", ".join(typed)),
+    ]
+    pages = (len(cities) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
+    page = 1
+    for _ in range(rng.randint(0, 2) if pages > 1 else 0):
+        page = page % pages + 1
+        steps.append(("handle_pagination", "callback", f"action=page&page={page}"))
+    exact = [city for city, text in zip(cities, typed) if city == text]
+    for city in rng.sample(exact, min(len(exact), rng.randint(0, 2))):
+        steps.append(("callback_details", "callback", f"action=details&city={city}&page={page}"))
+        if rng.random() < FORECAST_SHARE:
+            steps.append(("callback_forecast", "callback", f"action=forecast&city={city}&page={page}"))
+    steps.append(("callback_back", "callback", "back_to_menu"))
+    return steps
+
+
+class Results:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.sent = 0
+        self.completed = 0
+
+
+class Replay:
+    """Сессии пользователей с заданной средней частотой обновлений."""
+
+    def __init__(self, dp, bot, args):
+        self.dp = dp
+        self.bot = bot
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.update_id = 0
+        self.active: set[int] = set()
+        self.results = Results()
+        self.measure_from = 0.0
+
+    def _update(self, user_id: int, kind: str, value: str) -> dict:
+        self.update_id += 1
+        user = {"id": user_id, "is_bot": False, "first_name": "Load", "language_code": "ru"}
+        chat = {"id": user_id, "type": "private"}
+        if kind == "inline":
+            return {"update_id": self.update_id, "inline_query": {
+                "id": str(self.update_id), "from": user, "query": value, "offset": "",
+            }}
+        if kind == "message":
+            return {"update_id": self.update_id, "message": {
+                "message_id": self.update_id, "date": int(time.time()), "chat": chat, "from": user, "text": value,
+            }}
+        return {"update_id": self.update_id, "callback_query": {
+            "id": str(self.update_id), "from": user, "chat_instance": str(user_id), "data": value,
+            "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "…"},
+        }}
+
+    async def _session(self, user_id: int, deadline: float):
+        rng = random.Random(self.rng.random())
+        try:
+            for handler, kind, value in session_script(rng):
+                if time.perf_counter() >= deadline:
+                    return
+                update = self._update(user_id, kind, value)
+                measured = time.perf_counter() >= self.measure_from
+                self.results.sent += measured
+                started = time.perf_counter()
+                try:
+                    await self.dp.feed_raw_update(self.bot, update)
+                except Exception as e:
+                    if measured:
+                        self.results.errors[handler][type(e).__name__] += 1
+                else:
+                    if measured:
+                        self.results.latency[handler].append((time.perf_counter() - started) * 1000)
+                        self.results.completed += 1
+                pause = KEYSTROKE if kind == "inline" else self.args.think
+                await asyncio.sleep(pause * rng.uniform(0.5, 1.5))
+        finally:
+            self.active.discard(user_id)
+
+    async def run(self, measure_from: float, deadline: float):
+        self.measure_from = measure_from
+        # средняя длина сессии — по выборке сценариев
+        sample = random.Random(0)
+        mean_steps = sum(len(session_script(sample)) for _ in range(1000)) / 1000
+        interval = mean_steps / self.args.rate
+        tasks = set()
+        next_start = time.perf_counter()
+        while next_start < deadline:
+            await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+            next_start += self.rng.expovariate(1 / interval)
+            if len(self.active) >= self.args.users:
+                continue
+            user_id = self.rng.randint(1, self.args.users)
+            while user_id in self.active:
+                user_id = user_id % self.args.users + 1
+            self.active.add(user_id)
+            task = asyncio.create_task(self._session(user_id, deadline))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+async def stub_stats(session: aiohttp.ClientSession, url: str, reset: bool = False) -> Counter:
+    if reset:
+        async with session.post(f"{url}/_reset"):
+            pass
+        return Counter()
+    async with session.get(f"{url}/_stats") as response:
+        return Counter(await response.json())
+
+
+def summarize(args, results: Results, elapsed: float, owm: Counter, telegram: Counter, rss: tuple, throttled: int) -> dict:
+    completed = results.completed or 1
+    handlers = {}
+    for handler, values in sorted(results.latency.items()):
+        values.sort()
+        handlers[handler] = {
+            "count": len(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "errors": sum(results.errors[handler].values()),
+        }
+    return {
+        "target_rate": args.rate,
+        "sent_rate": results.sent / elapsed,
+        "throughput": results.completed / elapsed,
+        "handlers": handlers,
+        "errors": {h: dict(c) for h, c in results.errors.items() if c},
+        "throttled": throttled,
+        "owm_per_update": sum(v for k, v in owm.items() if not k.isdigit()) / completed,
+        "owm_faults": {k: owm[k] for k in ("429", "500") if owm[k]},
+        "telegram_per_update": sum(v for k, v in telegram.items() if not k.isdigit()) / completed,
+        "telegram_faults": {k: telegram[k] for k in ("429", "500") if telegram[k]},
+        "rss_start_mb": rss[0],
+        "rss_end_mb": rss[1],
+        "rss_growth_mb": rss[1] - rss[0],
+    }
+
+
+def print_report(report: dict):
+    print(f"rate:        target {report['target_rate']:.0f}/s, sent {report['sent_rate']:.1f}/s, "
+          f"completed {report['throughput']:.1f}/s")
+    print(f"{'handler':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for handler, row in report["handlers"].items():
+        print(f"{handler:<22}{row['count']:>8}{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}{row['errors']:>8}")
+    if report["errors"]:
+        print(f"errors:      {report['errors']}")
+    print(f"throttled:   {report['throttled']}")
+    print(f"upstream:    OWM {report['owm_per_update']:.3f}/update, Bot API {report['telegram_per_update']:.2f}/update")
+    if report["owm_faults"] or report["telegram_faults"]:
+        print(f"faults:      OWM {report['owm_faults']}, Bot API {report['telegram_faults']}")
+    print(f"rss:         {report['rss_start_mb']:.1f} -> {report['rss_end_mb']:.1f} MB "
+          f"({report['rss_growth_mb']:+.1f} MB)")
+    if report.get("utc_offset_missing"):
+        print(f"ERROR:       {report['utc_offset_missing']} cached cities without UTC offset")
+
+
+def profile_key(args) -> str:
+    """Профиль нагрузки: сравниваются только прогоны с одинаковыми параметрами."""
+    return " ".join(f"{k}={v}" for k, v in sorted(vars(args).items()) if k not in ("save_baseline", "tolerance"))
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Ухудшения относительно базового прогона (задержки — с допуском 1 мс на шум)."""
+    regressions = []
+
+    def check(name: str, current: float, base: float, higher_is_better: bool = False, slack: float = 0.0):
+        worse = current < base * (1 - tolerance) if higher_is_better else current > base * (1 + tolerance) + slack
+        change = (current - base) / base * 100 if base else 0.0
+        mark = "  REGRESSION" if worse else ""
+        print(f"  {name:<32}{base:>10.2f} -> {current:>10.2f} ({change:+.0f}%){mark}")
+        if worse:
+            regressions.append(name)
+
+    check("throughput", report["throughput"], baseline["throughput"], higher_is_better=True)
+    for handler, row in report["handlers"].items():
+        base = baseline["handlers"].get(handler)
+        if base:
+            check(f"{handler} p95 ms", row["p95"], base["p95"], slack=1.0)
+            check(f"{handler} p99 ms", row["p99"], base["p99"], slack=1.0)
+    check("owm_per_update", report["owm_per_update"], baseline["owm_per_update"], slack=0.005)
+    check("telegram_per_update", report["telegram_per_update"], baseline["telegram_per_update"], slack=0.05)
+    check("rss_growth_mb", report["rss_growth_mb"], baseline["rss_growth_mb"], slack=5.0)
+    return regressions
+
+
+async def run(args) -> dict:
+    telegram_port, owm_port = free_port(), free_port()
+    stubs = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "stubs.py"), "--telegram-port", str(telegram_port),
+         "--owm-port", str(owm_port), *stub_arguments(args)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    stubs.stdout.readline()  # заглушки печатают адреса после запуска
+    telegram_url = f"http://127.0.0.1:{telegram_port}"
+    owm_url = f"http://127.0.0.1:{owm_port}"
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "123456:bench",
+        "TELEGRAM_API_URL": telegram_url,
+        "OWM_BASE_URL": f"{owm_url}/data/2.5",
+        "OWM_API_KEY": "bench",
+        "OWM_CALLS_PER_MINUTE": str(args.owm_quota),
+        "METRICS_PORT": "0",
+        "BOT_LOG_TOKEN": "",  # лог-бот не должен слать события в настоящий Telegram
+        "ADMIN": "",
+        "LOG_LEVEL": "WARNING",
+    })
+
+    import database
+
+    database.DB_NAME = os.path.join(tempfile.mkdtemp(), "e2e_load.db")
+    import main as bot_main
+
+    database.create_tables()
+    # половина городов — с id в OWM, как после import_cities: их погода идёт через /group
+    conn = sqlite3.connect(database.DB_NAME)
+    with conn:
+        conn.executemany(
+            "INSERT INTO citys (name, aliases, owm_id) VALUES (?, '', ?)",
+            [(city, owm_city_id(city)) for city in CITIES[::2]],
+        )
+    conn.close()
+    bot_main.dp.include_router(bot_main.router)
+    await bot_main.on_startup(bot_main.dp)
+    try:
+        async with aiohttp.ClientSession() as session:
+            replay = Replay(bot_main.dp, bot_main.bot, args)
+            started = time.perf_counter()
+            measure_from = started + args.warmup
+            deadline = measure_from + args.duration
+            warmup = asyncio.create_task(replay.run(measure_from, deadline))
+            await asyncio.sleep(args.warmup)
+            # счётчики заглушек и память — с конца прогрева
+            await stub_stats(session, owm_url, reset=True)
+            await stub_stats(session, telegram_url, reset=True)
+            throttled_before = sum(v for k, v in bot_main.throttling_middleware.counts.items() if k != "passed")
+            rss_start = rss_mb()
+            await warmup
+            elapsed = time.perf_counter() - measure_from
+            owm = await stub_stats(session, owm_url)
+            telegram = await stub_stats(session, telegram_url)
+            rss_end = rss_mb()
+            throttled = sum(v for k, v in bot_main.throttling_middleware.counts.items() if k != "passed") - throttled_before
+            # заглушка отдаёт смещение +3 ч, в том числе в sys.timezone элементов /group
+            offset_missing = sum(
+                1 for _expires, weather in list(bot_main.weather_cache._data.values())
+                if weather.ok and not weather.timezone
+            )
+    finally:
+        await bot_main.on_shutdown(bot_main.dp)
+        bot_main.log_listener.stop()
+        stubs.terminate()
+        stubs.wait()
+    report = summarize(args, replay.results, elapsed, owm, telegram, (rss_start, rss_end), throttled)
+    report["utc_offset_missing"] = offset_missing
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=30, help="обновлений в секунду")
+    parser.add_argument("--duration", type=float, default=30, help="длительность замера, с")
+    parser.add_argument("--warmup", type=float, default=5, help="прогрев без замера, с")
+    parser.add_argument("--users", type=int, default=2000, help="размер пула пользователей")
+    parser.add_argument("--think", type=float, default=1.0, help="пауза пользователя между шагами, с")
+    parser.add_argument("--owm-quota", type=int, default=600, help="OWM_CALLS_PER_MINUTE для бота")
+    parser.add_argument("--seed", type=int, default=1)
+    add_fault_arguments(parser)
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результат как базовый")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if report["utc_offset_missing"]:
+        sys.exit(1)
+
+    key = profile_key(args)
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines[key] = report
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"baseline saved: {BASELINE_PATH}")
+    elif key in baselines:
+        print("baseline comparison:")
+        regressions = compare(report, baselines[key], args.tolerance)
+        if regressions:
+            print(f"regressions: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        print("no baseline for this profile (run with --save-baseline)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Локальные заглушки Telegram Bot API и OpenWeatherMap для нагрузочных тестов.
+Задержка, доля ошибок 5xx и ответов 429 настраиваются отдельно для каждого
+сервиса; GET /_stats отдаёт число запросов по методам, POST /_reset обнуляет.
+
+    python benchmarks/stubs.py --telegram-port 8081 --owm-port 8082 --owm-latency 0.08 --owm-429 0.01
+
+Бот направляется на заглушки через окружение:
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081 OWM_BASE_URL=http://127.0.0.1:8082/data/2.5 python main.py
+"""
+import argparse
+import asyncio
+import random
+import time
+import zlib
+from collections import Counter
+
+from aiohttp import web
+
+MESSAGE_METHODS = {"sendMessage", "sendPhoto", "editMessageText", "editMessageCaption", "editMessageReplyMarkup"}
+
+
+class Faults:
+    """Задержка (среднее, равномерный разброс ±50%) и доли ошибочных ответов."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, rate_limited: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limited = rate_limited
+
+    async def delay(self):
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def pick(self) -> int:
+        """200, 429 или 500."""
+        roll = random.random()
+        if roll < self.rate_limited:
+            return 429
+        if roll < self.rate_limited + self.error_rate:
+            return 500
+        return 200
+
+
+def _stats_routes(app: web.Application, counts: Counter):
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(dict(counts))
+
+    async def reset(request: web.Request) -> web.Response:
+        counts.clear()
+        return web.json_response({"ok": True})
+
+    app.router.add_get("/_stats", stats)
+    app.router.add_post("/_reset", reset)
+
+
+def telegram_app(faults: Faults) -> web.Application:
+    """Bot API: методы отправки возвращают сообщение, остальные — true."""
+    counts = Counter()
+    message_ids = Counter()
+
+    async def handle(request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        counts[method] += 1
+        params = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        await faults.delay()
+        status = faults.pick()
+        if status == 429:
+            counts["429"] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+        if status != 200:
+            counts["500"] += 1
+            return web.json_response({"ok": False, "error_code": 500, "description": "Internal Server Error"}, status=500)
+        if method not in MESSAGE_METHODS:
+            return web.json_response({"ok": True, "result": True})
+        chat_id = int(params.get("chat_id") or 0)
+        message_ids[chat_id] += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": int(params.get("message_id") or message_ids[chat_id]),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text") or params.get("caption") or "",
+        }})
+
+    app = web.Application()
+    _stats_routes(app, counts)
+    app.router.add_route("*", "/bot{token}/{method}", handle)
+    return app
+
+
+def owm_city_id(name: str) -> int:
+    """id, который заглушка выдаёт городу с этим названием."""
+    return zlib.crc32(name.encode()) % 10_000_000
+
+
+def _owm_city(name: str, owm_id: int, group: bool = False) -> dict:
+    """
+    Ответ /weather или (group=True) элемент списка /group: у них, как у OWM,
+    смещение часового пояса в timezone или в sys.timezone соответственно.
+    """
+    # стабильная "погода" по id, чтобы ответы одного города совпадали
+    seed = random.Random(owm_id)
+    now = int(time.time())
+    city = {
+        "id": owm_id,
+        "name": name,
+        "dt": now,
+        "visibility": 10000,
+        "main": {
+            "temp": round(seed.uniform(-20, 30), 1), "feels_like": round(seed.uniform(-25, 30), 1),
+            "humidity": seed.randint(20, 100), "pressure": seed.randint(980, 1040),
+        },
+        "wind": {"speed": round(seed.uniform(0, 15), 1), "deg": seed.randint(0, 359)},
+        "clouds": {"all": seed.randint(0, 100)},
+        "weather": [{"description": seed.choice(["ясно", "облачно", "небольшой дождь", "снег"])}],
+        "sys": {"country": "RU", "sunrise": now - 20000, "sunset": now + 20000},
+    }
+    if group:
+        city["sys"]["timezone"] = 10800
+    else:
+        city.update(cod=200, timezone=10800)
+    return city
+
+
+def _owm_forecast(name: str, owm_id: int) -> dict:
+    seed = random.Random(owm_id)
+    start = (int(time.time()) // 10800 + 1) * 10800
+    steps = []
+    for i in range(40):
+        code = seed.choice([800, 801, 803, 500, 600])
+        step = {
+            "dt": start + i * 10800,
+            "main": {"temp": round(seed.uniform(-20, 30), 1)},
+            "weather": [{"id": code, "description": {800: "ясно", 500: "небольшой дождь", 600: "снег"}.get(code, "облачно")}],
+        }
+        if code in (500, 600):
+            step["rain" if code == 500 else "snow"] = {"3h": round(seed.uniform(0.1, 3), 2)}
+        steps.append(step)
+    return {"cod": "200", "cnt": len(steps), "list": steps, "city": {"id": owm_id, "name": name, "timezone": 10800}}
+
+
+def owm_app(faults: Faults) -> web.Application:
+    """
+    /data/2.5/weather?q=, /data/2.5/group?id= и /data/2.5/forecast?q=|id=.
+    Название из запроса считается официальным; города с "xyz" в названии не существуют.
+    """
+    counts = Counter()
+    names: dict[int, str] = {}
+
+    async def fault_response() -> web.Response | None:
+        await faults.delay()
+        status = faults.pick()
+        if status == 200:
+            return None
+        counts[str(status)] += 1
+        headers = {"Retry-After": "1"} if status == 429 else None
+        return web.json_response({"cod": status, "message": "stub fault"}, status=status, headers=headers)
+
+    async def weather(request: web.Request) -> web.Response:
+        counts["weather"] += 1
+        if (fault := await fault_response()) is not None:
+            return fault
+        query = " ".join(request.query.get("q", "").split())
+        if not query or "xyz" in query.lower():
+            return web.json_response({"cod": "404", "message": "city not found"}, status=404)
+        name = query[:1].upper() + query[1:]
+        owm_id = owm_city_id(name)
+        names[owm_id] = name
+        return web.json_response(_owm_city(name, owm_id))
+
+    async def group(request: web.Request) -> web.Response:
+        counts["group"] += 1
+        if (fault := await fault_response()) is not None:
+            return fault
+        ids = [int(i) for i in request.query.get("id", "").split(",") if i]
+        cities = [_owm_city(names.get(i, f"City {i}"), i, group=True) for i in ids]
+        return web.json_response({"cnt": len(cities), "list": cities})
+
+    async def forecast(request: web.Request) -> web.Response:
+        counts["forecast"] += 1
+        if (fault := await fault_response()) is not None:
+            return fault
+        if "id" in request.query:
+            owm_id = int(request.query["id"])
+            name = names.get(owm_id, f"City {owm_id}")
+        else:
+            name = " ".join(request.query.get("q", "").split())
+            owm_id = owm_city_id(name)
+        if not name or "xyz" in name.lower():
+            return web.json_response({"cod": "404", "message": "city not found"}, status=404)
+        return web.json_response(_owm_forecast(name, owm_id))
+
+    app = web.Application()
+    _stats_routes(app, counts)
+    app.router.add_get("/data/2.5/forecast", forecast)
+    app.router.add_get("/data/2.5/weather", weather)
+    app.router.add_get("/data/2.5/group", group)
+    return app
+
+
+async def serve(host: str, telegram_port: int, owm_port: int, telegram: Faults, owm: Faults):
+    runners = []
+    for app, port in ((telegram_app(telegram), telegram_port), (owm_app(owm), owm_port)):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        runners.append(runner)
+    print(f"telegram: http://{host}:{telegram_port}  owm: http://{host}:{owm_port}/data/2.5", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--telegram-latency", type=float, default=0.03, help="средняя задержка Bot API, с")
+    parser.add_argument("--telegram-errors", type=float, default=0.0, help="доля ответов 500 Bot API")
+    parser.add_argument("--telegram-429", type=float, default=0.0, help="доля ответов 429 Bot API")
+    parser.add_argument("--owm-latency", type=float, default=0.08, help="средняя задержка OWM, с")
+    parser.add_argument("--owm-errors", type=float, default=0.0, help="доля ответов 500 OWM")
+    parser.add_argument("--owm-429", type=float, default=0.0, help="доля ответов 429 OWM")
+
+
+def stub_arguments(args: argparse.Namespace) -> list[str]:
+    """Аргументы командной строки заглушек из разобранных аргументов (для запуска подпроцессом)."""
+    return [
+        "--telegram-latency", str(args.telegram_latency), "--telegram-errors", str(args.telegram_errors),
+        "--telegram-429", str(args.telegram_429), "--owm-latency", str(args.owm_latency),
+        "--owm-errors", str(args.owm_errors), "--owm-429", str(args.owm_429),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--telegram-port", type=int, default=8081)
+    parser.add_argument("--owm-port", type=int, default=8082)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    telegram = Faults(args.telegram_latency, args.telegram_errors, args.telegram_429)
+    owm = Faults(args.owm_latency, args.owm_errors, args.owm_429)
+    try:
+        asyncio.run(serve(args.host, args.telegram_port, args.owm_port, telegram, owm))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Нагрузочный тест вебхука: отправляет синтетические Update JSON и считает
+задержку ответа. Для замера времени обработчиков сервер запускают
+с WEBHOOK_BACKGROUND=0 (ответ после обработки), а TELEGRAM_API_URL
+направляют на локальную заглушку Bot API (benchmarks/stubs.py).
+
+    BOT_MODE=webhook WEBHOOK_BACKGROUND=0 WEBHOOK_SECRET=s python main.py
+    python benchmarks/webhook_load.py --url http://127.0.0.1:8080/webhook --secret s
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import time
+
+import aiohttp
+
+TEXTS = [
+    "/start",
+    "👤 Мой профиль",
+    "🌡 Посмотреть температуру городов",
+    "привет",
+]
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load", "language_code": "ru"},
+            "text": random.choice(TEXTS),
+        },
+    }
+
+
+async def worker(session, args, counter, latencies, errors):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    while True:
+        update_id = next(counter)
+        if update_id >= args.requests:
+            return
+        payload = make_update(update_id, random.randint(1, args.users))
+        start = time.perf_counter()
+        try:
+            async with session.post(args.url, json=payload, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    errors[response.status] = errors.get(response.status, 0) + 1
+                    continue
+        except aiohttp.ClientError as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500)
+    args = parser.parse_args()
+
+    latencies = []
+    errors = {}
+    counter = itertools.count()
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(worker(session, args, counter, latencies, errors) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"requests: {len(latencies)} ok, errors: {errors or 0}")
+    print(f"rps:      {len(latencies) / elapsed:8.1f}")
+    if latencies:
+        print(f"p50:      {statistics.median(latencies):8.1f} ms")
+        print(f"p99:      {percentile(latencies, 0.99):8.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import time
+from types import MappingProxyType
+
+from database import run_db
+from fuzzy import FuzzyMatcher, PrefixIndex
+from utils import normalize_city
+
+CITY_INDEX_REFRESH = float(os.getenv("CITY_INDEX_REFRESH", "60"))
+# пауза перед полной перестройкой поиска: изменения за это время собираются в одну
+SEARCH_REBUILD_DELAY = float(os.getenv("SEARCH_REBUILD_DELAY", "30"))
+
+SQL_CITYS_STATE = "SELECT COUNT(*), COALESCE(MAX(version), 0) FROM citys"
+SQL_CITYS_ALL = "SELECT id, name, aliases, owm_id FROM citys"
+SQL_CITYS_CHANGED = "SELECT id, name, aliases, owm_id FROM citys WHERE version > ?"
+SQL_CITY_BY_NAME = "SELECT id, aliases, owm_id FROM citys WHERE name = ?"
+SQL_CITY_INSERT = "INSERT INTO citys (name, aliases, owm_id) VALUES (?, ?, ?)"
+SQL_CITY_UPDATE = "UPDATE citys SET aliases = ?, owm_id = ? WHERE id = ?"
+
+
+def _row_keys(name: str, aliases: str | None) -> tuple[str, ...]:
+    """Нормализованные варианты написания города из одной строки citys."""
+    variants = [normalize_city(v) for v in (aliases or "").split(",")]
+    variants.append(normalize_city(name))
+    return tuple(dict.fromkeys(v for v in variants if v))
+
+
+def _load_all(conn: sqlite3.Connection):
+    count, version = conn.execute(SQL_CITYS_STATE).fetchone()
+    aliases = {}
+    row_keys = {}
+    owm_ids = {}
+    for row_id, name, raw_aliases, owm_id in conn.execute(SQL_CITYS_ALL):
+        name = sys.intern(name)
+        keys = _row_keys(name, raw_aliases)
+        row_keys[row_id] = (name, keys)
+        for key in keys:
+            aliases[key] = name
+        if owm_id:
+            owm_ids[name] = owm_id
+    return aliases, row_keys, owm_ids, count, version
+
+
+def _load_changed(conn: sqlite3.Connection, since_version: int):
+    count, version = conn.execute(SQL_CITYS_STATE).fetchone()
+    if version <= since_version:
+        return [], count, version
+    rows = conn.execute(SQL_CITYS_CHANGED, (since_version,)).fetchall()
+    return rows, count, version
+
+
+def _save_cities(conn: sqlite3.Connection, cities: list):
+    """Запись найденных через API городов: новый город или новый алиас/id к существующему."""
+    with conn:
+        for user_city, official, owm_id in cities:
+            row = conn.execute(SQL_CITY_BY_NAME, (official,)).fetchone()
+            if row is None:
+                alias = user_city if normalize_city(user_city) != normalize_city(official) else ""
+                conn.execute(SQL_CITY_INSERT, (official, alias, owm_id))
+                continue
+            row_id, raw_aliases, old_owm_id = row
+            aliases = raw_aliases
+            if normalize_city(user_city) not in _row_keys(official, raw_aliases):
+                aliases = ", ".join(a for a in (raw_aliases, user_city) if a)
+            if aliases != raw_aliases or (owm_id and owm_id != old_owm_id):
+                conn.execute(SQL_CITY_UPDATE, (aliases, owm_id or old_owm_id, row_id))
+
+
+def _build_search(aliases: MappingProxyType) -> tuple[FuzzyMatcher, PrefixIndex]:
+    return FuzzyMatcher(aliases), PrefixIndex(aliases)
+
+
+class CityIndex:
+    """
+    Индекс алиасов городов в памяти: нормализованный алиас -> официальное название.
+    Строится один раз при старте, затем подтягивает только строки citys
+    с version больше загруженной. Удаление строк видно по расхождению
+    количества строк и приводит к полной перестройке.
+    Читатели всегда видят неизменяемый снимок: изменения применяются
+    к копии словаря, которая затем подменяет текущую.
+    Новые алиасы добавляются в нечёткий поиск (FuzzyMatcher) и поиск
+    по началу названия (PrefixIndex) на месте. Если алиас удалён или сменил
+    город, оба пересобираются в отдельном потоке фоновой задачей
+    не раньше чем через SEARCH_REBUILD_DELAY секунд; до этого поиск может
+    предлагать прежнее название, точный поиск (lookup) уже актуален.
+    """
+
+    def __init__(self, refresh_interval: float = CITY_INDEX_REFRESH):
+        self.refresh_interval = refresh_interval
+        self._aliases = MappingProxyType({})
+        self._fuzzy = FuzzyMatcher({})
+        self._prefix = PrefixIndex({})
+        self._row_keys: dict = {}  # id -> (name, keys)
+        self._owm_ids: dict = {}  # официальное название -> id города в OWM
+        self.version = 0
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._rebuild_task: asyncio.Task | None = None
+        self._search_stale = False  # удалённые или изменённые алиасы ещё в поиске
+        self._added: list = []  # алиасы, добавленные во время фоновой перестройки
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    @property
+    def aliases(self) -> MappingProxyType:
+        return self._aliases
+
+    async def load(self):
+        """Полная загрузка индекса."""
+        async with self._lock:
+            await self._load_full()
+
+    async def _load_full(self, rebuild_now: bool = True):
+        aliases, row_keys, owm_ids, _count, version = await run_db(_load_all)
+        self._aliases = MappingProxyType(aliases)
+        self._row_keys = row_keys
+        self._owm_ids = owm_ids
+        self.version = version
+        self._checked_at = time.monotonic()
+        if rebuild_now:
+            self._search_stale = False
+            self._added = []
+            self._fuzzy, self._prefix = await asyncio.to_thread(_build_search, self._aliases)
+        else:
+            self._schedule_rebuild()
+
+    def _schedule_rebuild(self):
+        self._search_stale = True
+        if self._rebuild_task is None or self._rebuild_task.done():
+            self._rebuild_task = asyncio.create_task(self._rebuild_later())
+
+    async def _rebuild_later(self):
+        await asyncio.sleep(SEARCH_REBUILD_DELAY)
+        while self._search_stale:
+            self._search_stale = False
+            self._added = []
+            fuzzy, prefix = await asyncio.to_thread(_build_search, self._aliases)
+            if self._search_stale:
+                continue  # за время сборки снова что-то удалили — собираем ещё раз
+            # алиасы, добавленные во время сборки, в снимок не попали
+            for key, name in self._added:
+                fuzzy.add(key, name)
+                prefix.add(key, name)
+            self._fuzzy, self._prefix = fuzzy, prefix
+            self._added = []
+
+    async def refresh(self):
+        """Догрузка изменённых строк citys."""
+        async with self._lock:
+            rows, count, version = await run_db(_load_changed, self.version)
+            self._checked_at = time.monotonic()
+            if rows:
+                self._apply(rows, version)
+            if len(self._row_keys) != count:
+                await self._load_full(rebuild_now=False)
+
+    def _apply(self, rows: list, version: int):
+        aliases = dict(self._aliases)
+        added = []
+        for row_id, name, raw_aliases, owm_id in rows:
+            name = sys.intern(name)
+            keys = _row_keys(name, raw_aliases)
+            old = self._row_keys.get(row_id)
+            if old is not None:
+                old_name, old_keys = old
+                for key in old_keys:
+                    if aliases.get(key) is old_name and (old_name is not name or key not in keys):
+                        del aliases[key]
+                        self._search_stale = True
+            self._row_keys[row_id] = (name, keys)
+            for key in keys:
+                previous = aliases.get(key)
+                if previous is None:
+                    added.append((key, name))
+                elif previous is not name:
+                    self._search_stale = True
+                aliases[key] = name
+            if owm_id:
+                self._owm_ids[name] = owm_id
+        self._aliases = MappingProxyType(aliases)
+        self.version = version
+        for key, name in added:
+            self._fuzzy.add(key, name)
+            self._prefix.add(key, name)
+        if self._rebuild_task is not None and not self._rebuild_task.done():
+            self._added.extend(added)
+        if self._search_stale:
+            self._schedule_rebuild()
+
+    async def ensure_fresh(self):
+        """Проверка изменений не чаще раза в refresh_interval секунд."""
+        if time.monotonic() - self._checked_at >= self.refresh_interval:
+            await self.refresh()
+
+    def lookup(self, city: str) -> str | None:
+        return self._aliases.get(normalize_city(city))
+
+    def owm_id(self, city: str) -> int | None:
+        """id города в OWM по названию или алиасу, если известен."""
+        official = self.lookup(city)
+        return self._owm_ids.get(official) if official else None
+
+    def correct(self, city: str) -> tuple[str | None, list[str]]:
+        """Исправление опечатки и варианты "возможно, вы имели в виду"."""
+        return self._fuzzy.correct(normalize_city(city))
+
+    def complete(self, prefix: str, limit: int = 50) -> list[str]:
+        """Города, название или алиас которых начинается с prefix."""
+        return self._prefix.search(normalize_city(prefix), limit)
+
+
+city_index = CityIndex()
+
+
+async def find_cities_in_db(city_list):
+    """
+    Возвращает (found, not_found).
+      found = [(user_input, official_name), ...]
+      not_found = [user_input, ...]
+    """
+    await city_index.ensure_fresh()
+
+    found = []
+    not_found = []
+    for city in city_list:
+        official = city_index.lookup(city)
+        if official is not None:
+            found.append((city, official))
+        else:
+            not_found.append(city)
+
+    return found, not_found
+
+
+async def remember_cities(cities):
+    """
+    Сохранение в citys городов, найденных через API, чтобы следующий поиск был локальным.
+      cities = [(user_input, official_name, owm_id), ...]
+    """
+    if not cities:
+        return
+    await run_db(_save_cities, cities)
+    await city_index.refresh()
+
+
+def match_fuzzy(city_list):
+    """
+    Нечёткий поиск городов, не найденных точно.
+    Возвращает (found, suggestions, unknown):
+      found = [(user_input, official_name), ...] — однозначные исправления;
+        это лишь кандидаты: набранное может оказаться другим городом,
+        поэтому подставлять их стоит, только если OWM его не знает
+      suggestions = {user_input: [official_name, ...]} — неоднозначные варианты
+      unknown = [user_input, ...] — ничего похожего в citys нет
+    """
+    found = []
+    suggestions = {}
+    unknown = []
+    for city in city_list:
+        official, variants = city_index.correct(city)
+        if official is not None:
+            found.append((city, official))
+        elif variants:
+            suggestions[city] = variants
+        else:
+            unknown.append(city)
+    return found, suggestions, unknown
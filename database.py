@@ -1,10 +1,80 @@
+import asyncio
+import logging
+import os
 import sqlite3
 import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import DB_QUERY_SECONDS
 
 DB_NAME = "weather_bot.db"
 
-def create_tables():
-    conn = sqlite3.connect(DB_NAME)
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0"))
+
+# Все обращения к БД идут через один выделенный поток с долгоживущим соединением,
+# поэтому дисковый ввод-вывод не блокирует event loop.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+_conn: sqlite3.Connection | None = None
+
+# SQL держим в константах: sqlite3 кэширует подготовленные выражения по тексту запроса
+SQL_INSERT_USER = "INSERT OR IGNORE INTO users (user_id, reg_datetime) VALUES (?, ?)"
+SQL_INSERT_LOG = "INSERT INTO query_logs (user_id, query, datetime) VALUES (?, ?, ?)"
+SQL_SUB_UPSERT = """
+    INSERT INTO subscriptions (user_id, city, send_time, utc_offset, slot, created_at) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, city) DO UPDATE SET
+        send_time = excluded.send_time, utc_offset = excluded.utc_offset, slot = excluded.slot
+"""
+SQL_SUB_LIST = "SELECT id, city, send_time FROM subscriptions WHERE user_id = ? ORDER BY send_time, city"
+SQL_SUB_DELETE = "DELETE FROM subscriptions WHERE id = ? AND user_id = ?"
+
+
+def _reset_after_fork():
+    """После fork (воркеры вебхука) поток и соединение родителя недоступны — создаём свои."""
+    global _executor, _conn
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+    _conn = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_NAME, cached_statements=256)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def _get_conn() -> sqlite3.Connection:
+    """Соединение создаётся лениво в потоке БД и живёт до close_db()."""
+    global _conn
+    if _conn is None:
+        _conn = _connect()
+    return _conn
+
+
+def _timed(func, args):
+    # время пишется из потока БД — единственного писателя этой метрики
+    started = time.perf_counter()
+    try:
+        return func(_get_conn(), *args)
+    finally:
+        DB_QUERY_SECONDS.labels(func.__name__).observe(time.perf_counter() - started)
+
+
+async def run_db(func, *args):
+    """Выполнение func(conn, *args) в потоке БД."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _timed, func, args)
+
+
+def _create_tables(conn: sqlite3.Connection):
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -24,67 +94,301 @@ def create_tables():
         )
     """)
 
+    # выборки по пользователю и по времени (аналитика, архивация) без полного просмотра
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_user_datetime ON query_logs(user_id, datetime)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_logs_datetime ON query_logs(datetime)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_reg_datetime ON users(reg_datetime)")
+
+    # агрегаты query_logs (см. analytics.py), обновляются инкрементально по id
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS query_rollup_hourly (
+            hour TEXT NOT NULL,
+            city TEXT NOT NULL,
+            queries INTEGER NOT NULL,
+            PRIMARY KEY (hour, city)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS query_rollup_daily (
+            day TEXT NOT NULL,
+            city TEXT NOT NULL,
+            queries INTEGER NOT NULL,
+            PRIMARY KEY (day, city)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_rollup_daily (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            queries INTEGER NOT NULL,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS citys (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
-            aliases TEXT
+            aliases TEXT,
+            version INTEGER NOT NULL DEFAULT 0,
+            owm_id INTEGER
         )
     """)
+    _add_column(cursor, "citys", "version", "INTEGER NOT NULL DEFAULT 0")
+    # id города в OWM — для пакетного запроса погоды через /group
+    _add_column(cursor, "citys", "owm_id", "INTEGER")
 
-    conn.commit()
-    conn.close()
+    # version растёт при каждой вставке/изменении строки: индекс алиасов
+    # в памяти подтягивает только строки с version больше уже загруженной
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_citys_version ON citys(version)")
+    # поиск строки по официальному названию (_save_cities, import_cities.py)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_citys_name ON citys(name)")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS citys_version_insert AFTER INSERT ON citys
+        BEGIN
+            UPDATE citys SET version = (SELECT COALESCE(MAX(version), 0) + 1 FROM citys)
+            WHERE id = NEW.id;
+        END
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS citys_version_update")
+    cursor.execute("""
+        CREATE TRIGGER citys_version_update AFTER UPDATE OF name, aliases, owm_id ON citys
+        BEGIN
+            UPDATE citys SET version = (SELECT COALESCE(MAX(version), 0) + 1 FROM citys)
+            WHERE id = NEW.id;
+        END
+    """)
 
-def register_user_if_not_exists(user_id: int):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
-    row = cur.fetchone()
-    if not row:
-        now = datetime.datetime.now()
-        cur.execute("INSERT INTO users (user_id, reg_datetime) VALUES (?, ?)", (user_id, now))
-        conn.commit()
-    conn.close()
+    # последний удачный ответ OWM по городу (см. weather_store.py):
+    # payload — Weather.to_bytes(), в старых строках — JSON
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS weather_payloads (
+            city_key TEXT PRIMARY KEY,
+            payload TEXT,
+            fetched_at REAL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_weather_payloads_fetched ON weather_payloads(fetched_at)")
+
+    # подписки на ежедневную погоду: send_time — местное время города,
+    # slot — та же минута суток по UTC, по ней рассылка выбирает подписчиков
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            city TEXT NOT NULL,
+            send_time TEXT NOT NULL,
+            utc_offset INTEGER NOT NULL,
+            slot INTEGER NOT NULL,
+            created_at DATETIME,
+            UNIQUE (user_id, city),
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_slot ON subscriptions(slot)")
+
+    # отметки рассылки (см. delivery.py): строка появляется до отправки,
+    # поэтому после перезапуска подписка за этот день повторно не отправляется
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deliveries (
+            sub_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            updated_at REAL,
+            PRIMARY KEY (sub_id, day)
+        ) WITHOUT ROWID
+    """)
+
+    # состояние FSM пользователей (см. fsm_storage.py), общее для всех процессов бота
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data BLOB,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_expires ON fsm_states(expires_at)")
 
-def log_query(user_id: int, text: str):
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    now = datetime.datetime.now()
-    cur.execute(
-        "INSERT INTO query_logs (user_id, query, datetime) VALUES (?, ?, ?)",
-        (user_id, text, now)
-    )
     conn.commit()
+
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    """Добавление столбца в существующую таблицу (миграция старых БД)."""
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def create_tables():
+    """Синхронное создание таблиц при старте (до запуска event loop)."""
+    _executor.submit(lambda: _create_tables(_get_conn())).result()
+
+
+def _close(conn: sqlite3.Connection):
+    global _conn
     conn.close()
+    _conn = None
+
 
-def find_cities_in_db(city_list):
+async def close_db():
+    """Закрытие соединения при завершении работы."""
+    if _conn is not None:
+        await run_db(_close)
+
+
+def _write_batch(conn: sqlite3.Connection, users: list, logs: list):
+    with conn:
+        if users:
+            conn.executemany(SQL_INSERT_USER, users)
+        if logs:
+            conn.executemany(SQL_INSERT_LOG, logs)
+
+
+_STOP = object()  # метка остановки в очереди записи
+
+
+class WriteBehindQueue:
     """
-    Возвращает (found, not_found).
-      found = [(user_input, official_name), ...]
-      not_found = [user_input, ...]
+    Фоновая пакетная запись регистраций и логов запросов.
+    Обработчики только кладут строки в очередь, одна задача сбрасывает их
+    в одной транзакции через executemany, когда набралось batch_size строк
+    или прошло flush_interval секунд.
+    Политика переполнения: новые строки логов отбрасываются (счётчик dropped),
+    регистрации пользователей пишутся в БД напрямую и не теряются.
     """
-    conn = sqlite3.connect(DB_NAME)
-    cur = conn.cursor()
-    cur.execute("SELECT name, aliases FROM citys")
-    rows = cur.fetchall()
-    conn.close()
 
-    aliases_map = {}
-    for row in rows:
-        db_name = row[0]
-        db_aliases = row[1] or ""
-        variants = [v.strip().lower() for v in db_aliases.split(',')]
-        variants.append(db_name.lower())
-        for v in variants:
-            aliases_map[v] = db_name
-
-    found = []
-    not_found = []
-    for city in city_list:
-        low = city.lower()
-        if low in aliases_map:
-            found.append((city, aliases_map[low]))
-        else:
-            not_found.append(city)
-
-    return found, not_found
+    def __init__(self, maxsize: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._pending: list = []
+        self._task: asyncio.Task | None = None
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, kind: str, row: tuple):
+        """kind: "user" или "log"."""
+        if not self.running:
+            await self._flush([(kind, row)])
+            return
+        try:
+            self._queue.put_nowait((kind, row))
+        except asyncio.QueueFull:
+            if kind == "user":
+                await self._flush([(kind, row)])
+            else:
+                self.dropped += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            stopping = item is _STOP
+            if not stopping:
+                self._pending.append(item)
+            deadline = loop.time() + self.flush_interval
+            while not stopping and len(self._pending) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                stopping = item is _STOP
+                if not stopping:
+                    self._pending.append(item)
+            batch, self._pending = self._pending, []
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        users = [row for kind, row in batch if kind == "user"]
+        logs = [row for kind, row in batch if kind == "log"]
+        try:
+            await run_db(_write_batch, users, logs)
+            self.written += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logging.error(f"Ошибка пакетной записи в БД: {e}", exc_info=True)
+
+    async def stop(self):
+        """
+        Остановка фоновой задачи и запись всего, что осталось в очереди.
+        Задача не отменяется: отмена прервала бы запись уже вынутой пачки.
+        Метка _STOP встаёт в конец очереди, задача дописывает всё до неё и завершается.
+        """
+        if self.running:
+            await self._queue.put(_STOP)
+            await self._task
+        self._task = None
+        batch, self._pending = self._pending, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self._flush(batch)
+
+
+write_queue = WriteBehindQueue(WRITE_QUEUE_SIZE, WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL)
+
+
+async def register_user_if_not_exists(user_id: int):
+    await write_queue.put("user", (user_id, datetime.datetime.now()))
+
+
+async def log_query(user_id: int, text: str):
+    await write_queue.put("log", (user_id, text, datetime.datetime.now()))
+
+
+def subscription_slot(send_time: str, utc_offset: int) -> int:
+    """Минута суток по UTC для местного времени ЧЧ:ММ при смещении utc_offset секунд."""
+    hours, minutes = map(int, send_time.split(":"))
+    return (hours * 60 + minutes - utc_offset // 60) % 1440
+
+
+def _add_subscription(conn: sqlite3.Connection, user_id: int, city: str, send_time: str, utc_offset: int):
+    slot = subscription_slot(send_time, utc_offset)
+    with conn:
+        conn.execute(SQL_SUB_UPSERT, (user_id, city, send_time, utc_offset, slot, datetime.datetime.now()))
+
+
+def _list_subscriptions(conn: sqlite3.Connection, user_id: int) -> list[tuple[int, str, str]]:
+    return conn.execute(SQL_SUB_LIST, (user_id,)).fetchall()
+
+
+def _delete_subscription(conn: sqlite3.Connection, sub_id: int, user_id: int) -> bool:
+    with conn:
+        return conn.execute(SQL_SUB_DELETE, (sub_id, user_id)).rowcount > 0
+
+
+async def add_subscription(user_id: int, city: str, send_time: str, utc_offset: int):
+    """Подписка (или смена времени) на ежедневную погоду города в местное время send_time."""
+    await run_db(_add_subscription, user_id, city, send_time, utc_offset)
+
+
+async def list_subscriptions(user_id: int) -> list[tuple[int, str, str]]:
+    """[(id, город, ЧЧ:ММ)] подписок пользователя."""
+    return await run_db(_list_subscriptions, user_id)
+
+
+async def delete_subscription(user_id: int, sub_id: int) -> bool:
+    return await run_db(_delete_subscription, sub_id, user_id)
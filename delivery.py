@@ -0,0 +1,230 @@
+import asyncio
+import contextlib
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from dotenv import load_dotenv
+
+from database import run_db
+from limiter import TokenBucket
+from scheduler import Priority
+from render import format_detailed_weather
+from weather import get_weather_many
+
+load_dotenv()
+
+# лимит Telegram на рассылку — около 30 сообщений в секунду на бота;
+# с платной рассылкой (allow_paid_broadcast) — до 1000
+DELIVERY_RATE = float(os.getenv("DELIVERY_RATE", "25"))
+DELIVERY_PAID_BROADCAST = os.getenv("DELIVERY_PAID_BROADCAST", "0") == "1"
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "16"))
+DELIVERY_CATCHUP = int(os.getenv("DELIVERY_CATCHUP", "30"))  # минут: досылка слотов, пропущенных при простое
+DELIVERY_CITY_CHUNK = 100  # городов на одну пачку запросов погоды
+DELIVERY_FINISH_BATCH = 200
+DELIVERY_ATTEMPTS = 3
+DELIVERY_KEEP_DAYS = 7
+
+SQL_DUE = """
+    SELECT s.id, s.user_id, s.city FROM subscriptions s
+    WHERE s.slot = ? AND NOT EXISTS (SELECT 1 FROM deliveries d WHERE d.sub_id = s.id AND d.day = ?)
+"""
+SQL_CLAIM = "INSERT OR IGNORE INTO deliveries (sub_id, day, status, updated_at) VALUES (?, ?, ?, ?)"
+SQL_FINISH = "UPDATE deliveries SET status = ?, updated_at = ? WHERE sub_id = ? AND day = ?"
+SQL_DROP_USER = "DELETE FROM subscriptions WHERE user_id = ?"
+SQL_PRUNE = "DELETE FROM deliveries WHERE day < ?"
+
+
+def _due(conn: sqlite3.Connection, slot: int, day: str) -> list[tuple[int, int, str]]:
+    return conn.execute(SQL_DUE, (slot, day)).fetchall()
+
+
+def _claim(conn: sqlite3.Connection, sub_ids: list[int], day: str, status: str) -> list[int]:
+    """Отметка подписок до отправки; возвращает те, что ещё никто не взял."""
+    now = time.time()
+    with conn:
+        return [sub_id for sub_id in sub_ids if conn.execute(SQL_CLAIM, (sub_id, day, status, now)).rowcount]
+
+
+def _finish(conn: sqlite3.Connection, rows: list[tuple]):
+    with conn:
+        conn.executemany(SQL_FINISH, rows)
+
+
+def _drop_user(conn: sqlite3.Connection, user_id: int):
+    with conn:
+        conn.execute(SQL_DROP_USER, (user_id,))
+
+
+def _prune(conn: sqlite3.Connection, before: str) -> int:
+    with conn:
+        return conn.execute(SQL_PRUNE, (before,)).rowcount
+
+
+class DeliveryScheduler:
+    """
+    Ежедневная рассылка погоды по подпискам.
+    Каждую минуту по UTC выбираются подписки этого слота, ещё не отмеченные
+    в deliveries за сегодня. Подписки одного пользователя склеиваются в одно
+    сообщение (одно сообщение в чат за слот — лимит на чат не нарушается),
+    погода каждого города запрашивается один раз: города идут пачками
+    по убыванию числа подписчиков, и сообщения, для которых погода уже есть,
+    сразу уходят в очередь отправки.
+    Отправляет пул из DELIVERY_WORKERS задач через общий токен-бакет
+    DELIVERY_RATE сообщений в секунду; retry_after от Telegram
+    приостанавливает всех отправителей.
+    Перед отправкой подписка отмечается (claimed) в БД, поэтому после
+    перезапуска или в другом процессе она не уйдёт повторно; пропущенные
+    за время простоя слоты (до DELIVERY_CATCHUP минут) досылаются при старте.
+    """
+
+    def __init__(self, bot: Bot, rate: float = DELIVERY_RATE, workers: int = DELIVERY_WORKERS):
+        self.bot = bot
+        self.workers = workers
+        self._bucket = TokenBucket(rate=rate, capacity=rate)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._finished: list[tuple] = []
+        self._paused_until = 0.0
+        self.counts = Counter()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._send_worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._run()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        await self._flush_finished()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def _run(self):
+        now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        cursor = now - timedelta(minutes=DELIVERY_CATCHUP)
+        before = (now - timedelta(days=DELIVERY_KEEP_DAYS)).date().isoformat()
+        await run_db(_prune, before)
+        while True:
+            now = datetime.now(timezone.utc)
+            # слот мог обрабатываться дольше минуты — догоняем все пропущенные
+            while cursor <= now:
+                try:
+                    await self.process_slot(cursor)
+                except Exception as e:
+                    logging.error(f"Ошибка рассылки слота {cursor:%H:%M}: {e}", exc_info=True)
+                cursor += timedelta(minutes=1)
+            await asyncio.sleep((cursor - datetime.now(timezone.utc)).total_seconds())
+
+    async def process_slot(self, at: datetime) -> int:
+        """Постановка в очередь сообщений слота at (UTC); возвращает число сообщений."""
+        day = at.date().isoformat()
+        rows = await run_db(_due, at.hour * 60 + at.minute, day)
+        if not rows:
+            return 0
+        started = time.perf_counter()
+
+        by_user = defaultdict(list)
+        subscribers = Counter()
+        for sub_id, user_id, city in rows:
+            by_user[user_id].append((sub_id, city))
+            subscribers[city] += 1
+        cities = [city for city, _count in subscribers.most_common()]
+        chunk_of = {city: i // DELIVERY_CITY_CHUNK for i, city in enumerate(cities)}
+
+        # сообщение готово, когда загружена пачка с последним из его городов
+        ready = defaultdict(list)
+        for user_id, subs in by_user.items():
+            ready[max(chunk_of[city] for _sub_id, city in subs)].append((user_id, subs))
+
+        texts = {}
+        messages = 0
+        for chunk in range(0, len(cities), DELIVERY_CITY_CHUNK):
+            names = cities[chunk:chunk + DELIVERY_CITY_CHUNK]
+            results = await get_weather_many(names, Priority.NORMAL)
+            for city, data in zip(names, results):
+                # текст по городу строится один раз на всех подписчиков
+                texts[city] = format_detailed_weather(city, data) if data.ok else None
+            for user_id, subs in ready.pop(chunk // DELIVERY_CITY_CHUNK, ()):
+                messages += await self._enqueue(user_id, subs, texts, day)
+
+        self.counts["slots"] += 1
+        logging.info(
+            "Рассылка %s %02d:%02d UTC: %s подписок, %s городов, %s сообщений в очереди за %.2f с",
+            day, at.hour, at.minute, len(rows), len(cities), messages, time.perf_counter() - started,
+        )
+        return messages
+
+    async def _enqueue(self, user_id: int, subs: list[tuple[int, str]], texts: dict, day: str) -> int:
+        missing = [sub_id for sub_id, city in subs if texts[city] is None]
+        if missing:
+            # погоды нет (город пропал или OWM недоступен) — отмечаем, чтобы не досылать
+            self.counts["no_data"] += len(await run_db(_claim, missing, day, "no_data"))
+        subs = [(sub_id, city) for sub_id, city in subs if texts[city] is not None]
+        if not subs:
+            return 0
+        text = "<b>🔔 Ежедневная погода</b>\n\n" + "\n\n".join(texts[city] for _sub_id, city in subs)
+        self._queue.put_nowait((user_id, [sub_id for sub_id, _city in subs], text, day))
+        return 1
+
+    async def _send_worker(self):
+        while True:
+            user_id, sub_ids, text, day = await self._queue.get()
+            try:
+                sub_ids = await run_db(_claim, sub_ids, day, "claimed")
+                if sub_ids:
+                    status = await self._send(user_id, text)
+                    self.counts[status] += 1
+                    self._finished.extend((status, time.time(), sub_id, day) for sub_id in sub_ids)
+                    if len(self._finished) >= DELIVERY_FINISH_BATCH or self._queue.empty():
+                        await self._flush_finished()
+                else:
+                    self.counts["duplicate"] += 1
+            except Exception as e:
+                self.counts["failed"] += 1
+                logging.error(f"Ошибка рассылки пользователю {user_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, user_id: int, text: str) -> str:
+        for _attempt in range(DELIVERY_ATTEMPTS):
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self._bucket.acquire()
+            try:
+                await self.bot.send_message(
+                    user_id, text, parse_mode="HTML",
+                    allow_paid_broadcast=DELIVERY_PAID_BROADCAST or None,
+                )
+                return "sent"
+            except TelegramRetryAfter as e:
+                self.counts["retry_after"] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except TelegramForbiddenError:
+                # бот заблокирован — подписки пользователя больше не нужны
+                await run_db(_drop_user, user_id)
+                return "blocked"
+            except TelegramBadRequest as e:
+                logging.warning(f"Рассылка пользователю {user_id} отклонена: {e}")
+                return "failed"
+        return "failed"
+
+    async def _flush_finished(self):
+        rows, self._finished = self._finished, []
+        if rows:
+            await run_db(_finish, rows)
+
+    def stats(self) -> dict:
+        return {"queued": self.qsize(), **self.counts}
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from city_index import city_index
+from scheduler import Priority, scheduler
+from utils import normalize_city
+from weather import LANG, OWM_API_KEY, OWM_BASE_URL, UNITS
+from weather_cache import WeatherCache
+from weather_model import DayForecast, Forecast
+
+load_dotenv()
+
+FORECAST_URL = f"{OWM_BASE_URL}/forecast"
+FORECAST_STEP = 3 * 3600  # шаг прогноза OWM
+FORECAST_MIN_TTL = 600
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "1024"))
+
+# прогноз пересчитывается раз в шаг: запись живёт до ближайшего шага (см. _ttl_for)
+forecast_cache = WeatherCache(ttl=FORECAST_STEP, maxsize=FORECAST_CACHE_SIZE)
+
+
+def aggregate_many(responses: list[dict]) -> list[Forecast]:
+    """
+    Сводка по дням для пачки ответов /forecast одним набором операций NumPy.
+    Шаги всех городов склеиваются в плоские массивы; ответ OWM упорядочен
+    по времени, поэтому группы (город, местный день) идут подряд
+    и сворачиваются через reduceat. Преобладающая погода — самый частый
+    код за день (при равенстве — меньший код, т. е. более значимое явление).
+    """
+    indices = [i for i, r in enumerate(responses) if r.get("status", 200) == 200 and r.get("list")]
+    ok = [responses[i] for i in indices]
+    results = [Forecast(status=_status(r), message=str(r.get("message", ""))) for r in responses]
+    if ok:
+        steps = [step for r in ok for step in r["list"]]
+        n = len(steps)
+        # разбор JSON — единственный проход Python, дальше только операции над массивами
+        dt = np.fromiter((s["dt"] for s in steps), np.int64, n)
+        temp = np.fromiter((s["main"]["temp"] for s in steps), np.float64, n)
+        rain = np.fromiter(((s.get("rain") or {}).get("3h", 0.0) for s in steps), np.float64, n)
+        snow = np.fromiter(((s.get("snow") or {}).get("3h", 0.0) for s in steps), np.float64, n)
+        weather = [(s.get("weather") or [{}])[0] for s in steps]
+        codes = np.fromiter((w.get("id", 800) for w in weather), np.int64, n)
+        descriptions = {w.get("id", 800): w.get("description", "") for w in weather}
+
+        city = np.repeat(np.arange(len(ok)), [len(r["list"]) for r in ok])
+        offsets = np.array([r.get("city", {}).get("timezone", 0) for r in ok], np.int64)
+        day = (dt + offsets[city]) // 86400
+
+        change = np.empty(n, bool)
+        change[0] = True
+        np.not_equal(city[1:], city[:-1], out=change[1:])
+        change[1:] |= day[1:] != day[:-1]
+        starts = np.flatnonzero(change)
+        group = np.cumsum(change) - 1
+
+        temp_min = np.minimum.reduceat(temp, starts)
+        temp_max = np.maximum.reduceat(temp, starts)
+        temp_mean = np.add.reduceat(temp, starts) / np.diff(np.append(starts, n))
+        precipitation = np.add.reduceat(rain + snow, starts)
+
+        unique_codes, code_index = np.unique(codes, return_inverse=True)
+        freq = np.zeros((len(starts), len(unique_codes)), np.int32)
+        np.add.at(freq, (group, code_index), 1)
+        dominant = unique_codes[freq.argmax(axis=1)]
+
+        group_city = city[starts]
+        city_starts = np.searchsorted(group_city, np.arange(len(ok) + 1))
+        first_dt = dt[np.searchsorted(city, np.arange(len(ok)))]
+        rows = list(zip(
+            day[starts].astype("datetime64[D]").astype(str).tolist(),
+            np.round(temp_min, 1).tolist(), np.round(temp_max, 1).tolist(), np.round(temp_mean, 1).tolist(),
+            np.round(precipitation, 1).tolist(), dominant.tolist(),
+        ))
+        now = time.time()
+        for i, (index, r) in enumerate(zip(indices, ok)):
+            city_rows = rows[city_starts[i]:city_starts[i + 1]]
+            expires_at = int(first_dt[i])
+            if expires_at <= now:
+                expires_at += FORECAST_STEP
+            results[index] = Forecast(
+                status=200,
+                name=r.get("city", {}).get("name", ""),
+                timezone=int(offsets[i]),
+                days=tuple(DayForecast(*row, descriptions.get(row[5], "")) for row in city_rows),
+                expires_at=expires_at,
+                fetched_at=now,
+            )
+    return results
+
+
+def _status(response: dict) -> int:
+    status = int(response.get("status", 200))
+    return 404 if status == 200 else status  # 200 без шагов прогноза — города нет
+
+
+def aggregate(response: dict) -> Forecast:
+    return aggregate_many([response])[0]
+
+
+async def fetch_forecast(city_name: str, priority: Priority = Priority.INTERACTIVE) -> dict:
+    """Сырой ответ /forecast; город с известным id запрашивается по id."""
+    owm_id = city_index.owm_id(city_name)
+    params = {"id": owm_id} if owm_id else {"q": city_name}
+    params.update({"appid": OWM_API_KEY, "units": UNITS, "lang": LANG})
+    return await scheduler.get_json(FORECAST_URL, params, api_key=OWM_API_KEY, priority=priority)
+
+
+async def _load_many(names: dict, priority: Priority) -> dict:
+    keys = list(names)
+    responses = await asyncio.gather(*(fetch_forecast(names[key], priority) for key in keys))
+    return dict(zip(keys, aggregate_many(responses)))
+
+
+def _ttl_for(forecast: Forecast) -> float:
+    return min(FORECAST_STEP, max(FORECAST_MIN_TTL, forecast.expires_at - time.time()))
+
+
+async def get_forecast_many(city_names: list[str], priority: Priority = Priority.INTERACTIVE) -> list[Forecast]:
+    """Прогнозы через кэш: промахи загружаются одновременно и сворачиваются одной пачкой."""
+    names = {normalize_city(city): city for city in city_names}
+    return await forecast_cache.get_or_load_many(
+        [normalize_city(city) for city in city_names],
+        lambda missing: _load_many({key: names[key] for key in missing}, priority),
+        cacheable=lambda forecast: forecast.ok,
+        ttl_for=_ttl_for,
+    )
+
+
+async def get_forecast(city_name: str, priority: Priority = Priority.INTERACTIVE) -> Forecast:
+    return (await get_forecast_many([city_name], priority))[0]
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from dotenv import load_dotenv
+
+from database import run_db
+
+load_dotenv()
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")  # memory | sqlite | redis
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0")
+FSM_TTL = int(os.getenv("FSM_TTL", str(24 * 3600)))  # брошенные сессии удаляются через сутки
+FSM_PRUNE_INTERVAL = 600
+FSM_COMPRESS_MIN = 512  # данные длиннее (байт) сжимаются zlib
+
+SQL_FSM_SELECT = "SELECT state, data FROM fsm_states WHERE key = ? AND expires_at > ?"
+# просроченная, но ещё не удалённая строка не воскресает: второй столбец обнуляется
+SQL_FSM_UPSERT_STATE = """
+    INSERT INTO fsm_states (key, state, expires_at) VALUES (:key, :value, :expires_at)
+    ON CONFLICT(key) DO UPDATE SET
+        state = excluded.state,
+        data = CASE WHEN fsm_states.expires_at <= :now THEN NULL ELSE fsm_states.data END,
+        expires_at = excluded.expires_at
+"""
+SQL_FSM_UPSERT_DATA = """
+    INSERT INTO fsm_states (key, data, expires_at) VALUES (:key, :value, :expires_at)
+    ON CONFLICT(key) DO UPDATE SET
+        data = excluded.data,
+        state = CASE WHEN fsm_states.expires_at <= :now THEN NULL ELSE fsm_states.state END,
+        expires_at = excluded.expires_at
+"""
+SQL_FSM_DELETE_EMPTY = "DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND data IS NULL"
+SQL_FSM_PRUNE = "DELETE FROM fsm_states WHERE expires_at <= ?"
+
+_ZLIB_MARK = b"z"
+
+
+def dumps_compact(data: dict) -> str:
+    """JSON без пробелов и \\u-экранирования кириллицы: список городов вдвое короче."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _encode(data: dict) -> bytes | None:
+    if not data:
+        return None
+    raw = dumps_compact(data).encode()
+    if len(raw) >= FSM_COMPRESS_MIN:
+        return _ZLIB_MARK + zlib.compress(raw, 1)
+    return raw
+
+
+def _decode(blob: bytes | None) -> dict:
+    if not blob:
+        return {}
+    if blob[:1] == _ZLIB_MARK:
+        blob = zlib.decompress(blob[1:])
+    return json.loads(blob)
+
+
+def _upsert(conn: sqlite3.Connection, sql: str, key: str, value):
+    now = time.time()
+    conn.execute(sql, {"key": key, "value": value, "expires_at": now + FSM_TTL, "now": now})
+
+
+def _select(conn: sqlite3.Connection, key: str) -> tuple[str | None, bytes | None]:
+    row = conn.execute(SQL_FSM_SELECT, (key, time.time())).fetchone()
+    return row if row else (None, None)
+
+
+def _set_state(conn: sqlite3.Connection, key: str, state: str | None):
+    with conn:
+        _upsert(conn, SQL_FSM_UPSERT_STATE, key, state)
+        if state is None:
+            conn.execute(SQL_FSM_DELETE_EMPTY, (key,))
+
+
+def _set_data(conn: sqlite3.Connection, key: str, blob: bytes | None):
+    with conn:
+        _upsert(conn, SQL_FSM_UPSERT_DATA, key, blob)
+        if blob is None:
+            conn.execute(SQL_FSM_DELETE_EMPTY, (key,))
+
+
+def _get_data(conn: sqlite3.Connection, key: str) -> dict:
+    return _decode(_select(conn, key)[1])
+
+
+def _update_data(conn: sqlite3.Connection, key: str, patch: dict) -> dict:
+    # чтение и запись в одной транзакции: другие процессы не вклиниваются между ними
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        data = _get_data(conn, key)
+        data.update(patch)
+        blob = _encode(data)
+        _upsert(conn, SQL_FSM_UPSERT_DATA, key, blob)
+        if blob is None:
+            conn.execute(SQL_FSM_DELETE_EMPTY, (key,))
+    return data
+
+
+def _prune(conn: sqlite3.Connection, now: float) -> int:
+    with conn:
+        return conn.execute(SQL_FSM_PRUNE, (now,)).rowcount
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM в таблице fsm_states общей БД: состояние и данные пользователя
+    переживают перезапуск и видны всем процессам (несколько поллеров
+    или воркеров вебхука). Одна строка на ключ, данные — компактный JSON,
+    длинные списки городов сжимаются zlib. Запись продлевает срок жизни
+    на FSM_TTL, просроченные строки не читаются и периодически удаляются.
+    """
+
+    def __init__(self, key_builder: DefaultKeyBuilder | None = None):
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self._next_prune = 0.0
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await run_db(_set_state, self.key_builder.build(key), value)
+        await self._maybe_prune()
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await run_db(_select, self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        await run_db(_set_data, self.key_builder.build(key), _encode(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        # один запрос по первичному ключу, распаковка — в потоке БД
+        return await run_db(_get_data, self.key_builder.build(key))
+
+    async def update_data(self, key: StorageKey, data: dict[str, Any]) -> dict[str, Any]:
+        return await run_db(_update_data, self.key_builder.build(key), data)
+
+    async def prune(self) -> int:
+        """Удаление просроченных сессий."""
+        removed = await run_db(_prune, time.time())
+        if removed:
+            logging.info("FSM: удалено %s просроченных сессий", removed)
+        return removed
+
+    async def _maybe_prune(self):
+        now = time.monotonic()
+        if now >= self._next_prune:
+            self._next_prune = now + FSM_PRUNE_INTERVAL
+            await self.prune()
+
+    async def close(self) -> None:
+        # соединение общее с остальным ботом, его закрывает close_db()
+        pass
+
+
+def create_storage() -> BaseStorage:
+    """Хранилище FSM по FSM_STORAGE."""
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if FSM_STORAGE == "redis":
+        # redis — необязательная зависимость, нужна только в этом режиме
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        return RedisStorage.from_url(
+            FSM_REDIS_URL,
+            state_ttl=FSM_TTL,
+            data_ttl=FSM_TTL,
+            json_dumps=dumps_compact,
+        )
+    return SQLiteStorage()
@@ -0,0 +1,131 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Mapping
+
+# сколько кандидатов по триграммам проверяем точным расстоянием
+CANDIDATES = 30
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_distance(text: str) -> int:
+    """Допустимое число опечаток в зависимости от длины названия."""
+    if len(text) <= 4:
+        return 1
+    if len(text) <= 10:
+        return 2
+    return 3
+
+
+def levenshtein(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна с отсечкой: при превышении limit возвращает limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class FuzzyMatcher:
+    """
+    Поиск городов с опечатками без обращения к API.
+    Триграммный индекс отбирает кандидатов, точное расстояние Левенштейна
+    ранжирует их. На 100k+ алиасов поиск занимает единицы миллисекунд.
+    Ключи aliases должны быть уже нормализованы (utils.normalize_city).
+    """
+
+    def __init__(self, aliases: Mapping[str, str]):
+        self._keys = list(aliases)
+        self._names = [aliases[key] for key in self._keys]
+        postings: dict = {}
+        for key_id, key in enumerate(self._keys):
+            for gram in _trigrams(key):
+                postings.setdefault(gram, array("I")).append(key_id)
+        self._postings = postings
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: str, name: str):
+        """Новый алиас без перестройки индекса (ключ не должен уже быть в индексе)."""
+        key_id = len(self._keys)
+        self._keys.append(key)
+        self._names.append(name)
+        for gram in _trigrams(key):
+            self._postings.setdefault(gram, array("I")).append(key_id)
+
+    def search(self, query: str, limit: int = 3) -> list[tuple[int, str]]:
+        """Ранжированный список (расстояние, название) по нормализованному запросу."""
+        max_dist = max_distance(query)
+        counts = Counter()
+        for gram in _trigrams(query):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                counts.update(posting)
+
+        best: dict = {}
+        for key_id, _common in counts.most_common(CANDIDATES):
+            dist = levenshtein(query, self._keys[key_id], max_dist)
+            if dist > max_dist:
+                continue
+            name = self._names[key_id]
+            if dist < best.get(name, max_dist + 1):
+                best[name] = dist
+        ranked = sorted((dist, name) for name, dist in best.items())
+        return ranked[:limit]
+
+    def correct(self, query: str) -> tuple[str | None, list[str]]:
+        """
+        Возвращает (исправление, варианты).
+        Исправление есть, только если лучший вариант однозначен.
+        """
+        ranked = self.search(query)
+        if not ranked:
+            return None, []
+        names = [name for _dist, name in ranked]
+        if len(ranked) == 1 or ranked[0][0] < ranked[1][0]:
+            return names[0], names
+        return None, names
+
+
+class PrefixIndex:
+    """
+    Поиск по началу алиаса (inline-режим, поиск по мере набора).
+    Алиасы отсортированы, начало диапазона находится бинарным поиском.
+    """
+
+    def __init__(self, aliases: Mapping[str, str]):
+        self._keys = sorted(aliases)
+        self._names = [aliases[key] for key in self._keys]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: str, name: str):
+        """Новый алиас с сохранением порядка (ключ не должен уже быть в индексе)."""
+        i = bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._names.insert(i, name)
+
+    def search(self, prefix: str, limit: int = 50) -> list[str]:
+        """Официальные названия (до limit) с алиасом, начинающимся с prefix."""
+        names: dict = {}
+        i = bisect_left(self._keys, prefix)
+        while i < len(self._keys) and len(names) < limit and self._keys[i].startswith(prefix):
+            names.setdefault(self._names[i], None)
+            i += 1
+        return list(names)
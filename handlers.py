@@ -1,18 +1,35 @@
+import os
+import re
+import time
+
 from aiogram import Router, F, Bot
 from aiogram.types import BotCommand, BotCommandScopeChat
 from aiogram import Bot
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
+from aiogram.types import InlineQuery, InlineQueryResultsButton
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command, StateFilter
 
-from database import register_user_if_not_exists, log_query, find_cities_in_db
+from database import register_user_if_not_exists, log_query, add_subscription, list_subscriptions, delete_subscription
+from city_index import find_cities_in_db, match_fuzzy, remember_cities
 from user_commands import user_commands
-from weather import get_weather_label, get_detailed_weather, check_city_exists, get_weather_label_parallel
+from weather import get_weather, get_weather_label, get_detailed_weather, get_weather_label_parallel, resolve_city, resolve_cities, is_cached
+from prefetch import prefetcher
+from analytics import query_rollup
+from inline import inline_search
+from forecast import get_forecast
+from render import format_forecast
 from keyboards import main_menu, get_back_keyboard
-from states import States
+from states import States, SubscribeStates
 
 router = Router()
 
+ITEMS_PER_PAGE = 4
+SUBSCRIPTIONS_LIMIT = 5  # городов в одной ежедневной рассылке пользователя
+TIME_RE = re.compile(r"^([01]?\d|2[0-3])[:.]([0-5]\d)$")
+CALLBACK_DATA_LIMIT = 64  # байт, ограничение Telegram
+ADMIN_ID = int(os.getenv("ADMIN")) if (os.getenv("ADMIN") or "").isdigit() else None
+
 async def set_pagination_state(state: FSMContext, cities: list, page: int = 1):
     await state.update_data(cities=cities, current_page=page)
 
@@ -27,6 +44,7 @@ async def show_welcome(update: Message | CallbackQuery, state: FSMContext, bot:
     await state.clear()
     
     user = update.from_user
+    prefetcher.cancel(user.id)  # пользователь ушёл из списка городов
     is_message = isinstance(update, Message)
     
     text = (
@@ -55,7 +73,7 @@ async def show_welcome(update: Message | CallbackQuery, state: FSMContext, bot:
 @router.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext, bot: Bot):
     """Команда /start."""
-    register_user_if_not_exists(message.from_user.id)
+    await register_user_if_not_exists(message.from_user.id)
     await show_welcome(message, state, bot)
 
 @router.callback_query(F.data == "back_to_menu")
@@ -73,6 +91,7 @@ async def handle_view_cities(message: Message, state: FSMContext):
         "👉 Например:</b> <blockquote>Волгоград, Воронеж, Волжский, Пермь</blockquote>"
     )
     await message.answer(text, reply_markup=kb, parse_mode="HTML")
+    prefetcher.cancel(message.from_user.id)  # страницы прежнего списка больше не нужны
     await state.set_state(States.waiting_for_cities)
 
 
@@ -100,11 +119,64 @@ async def handle_my_profile(message: Message, state: FSMContext):
 
 
 
+# кнопки меню и команды — до обработчиков ввода по состоянию,
+# иначе в режиме ввода городов они были бы приняты за название города
+async def show_subscriptions(message: Message, user_id: int, edit: bool = False):
+    """Список подписок с кнопками удаления."""
+    subs = await list_subscriptions(user_id)
+    rows = [
+        [InlineKeyboardButton(text=f"❌ {city} в {send_time}", callback_data=f"sub=del&id={sub_id}")]
+        for sub_id, city, send_time in subs
+    ]
+    if len(subs) < SUBSCRIPTIONS_LIMIT:
+        rows.append([InlineKeyboardButton(text="➕ Добавить город", callback_data="sub=add")])
+    rows.append([InlineKeyboardButton(text="🔙 Вернуться", callback_data="back_to_menu")])
+    kb = InlineKeyboardMarkup(inline_keyboard=rows)
+
+    if subs:
+        text = "<b>🔔 Ежедневная погода приходит в местное время города\n\n👇 Нажмите на подписку, чтобы удалить её</b>"
+    else:
+        text = "<b>🔔 У вас пока нет подписок\n\nДобавьте город, и погода будет приходить каждый день в выбранное время</b>"
+    if edit:
+        await message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    else:
+        await message.answer(text, reply_markup=kb, parse_mode="HTML")
+
+
+@router.message(F.text == "🔔 Подписки")
+async def handle_subscriptions(message: Message, state: FSMContext):
+    await state.clear()
+    prefetcher.cancel(message.from_user.id)  # пользователь ушёл из списка городов
+    await show_subscriptions(message, message.from_user.id)
+
+
+def _format_top(rows: list) -> str:
+    return "\n".join(f"{i}. {city} — {count}" for i, (city, count) in enumerate(rows, 1)) or "нет данных"
+
+
+@router.message(Command("stats"), F.from_user.id == ADMIN_ID)
+async def cmd_stats(message: Message):
+    """Сводка для админа по агрегатам запросов (без просмотра query_logs)."""
+    summary = await query_rollup.summary()
+    top_users = ", ".join(f"<code>{user_id}</code> ({count})" for user_id, count in summary["top_users_week"]) or "нет данных"
+    text = (
+        "<b>📊 Статистика за сегодня</b>\n"
+        f"• Запросов: {summary['queries']}\n"
+        f"• Активных пользователей: {summary['active_users']}\n"
+        f"• Новых пользователей: {summary['new_users']}\n"
+        f"• Всего пользователей: {summary['total_users']}\n\n"
+        f"<b>🏙 Топ городов сегодня</b>\n{_format_top(summary['top_today'])}\n\n"
+        f"<b>🏙 Топ городов за 7 дней</b>\n{_format_top(summary['top_week'])}\n\n"
+        f"<b>👥 Самые активные за 7 дней:</b> {top_users}"
+    )
+    await message.answer(text, parse_mode="HTML")
+
+
 @router.message(StateFilter(States.waiting_for_cities))
 async def process_city_list(message: Message, state: FSMContext):
     user_id = message.from_user.id
     user_text = message.text.strip()
-    log_query(user_id, user_text)
+    await log_query(user_id, user_text)
 
     if not user_text:
         kb = get_back_keyboard()
@@ -118,24 +190,43 @@ async def process_city_list(message: Message, state: FSMContext):
         await message.answer("❌ Вы не ввели никаких городов", reply_markup=kb)
         return
 
-    found, not_found = find_cities_in_db(cities)
-    additional_found = []
-    for city in not_found:
-        exists, _lbl = await check_city_exists(city)
-        if exists:
-            additional_found.append((city, city))
+    found, not_found = await find_cities_in_db(cities)
 
-    if additional_found:
-        found.extend(additional_found)
-        not_found = [c for c in not_found if not any(c == f[0] for f in additional_found)]
+    # похожее название из справочника подставляем, только если OWM не знает набранного:
+    # "Орск" — отдельный город, а не опечатка в "Омск"
+    corrected, suggestions, unknown = match_fuzzy(not_found)
+    checked = unknown + [city for city, _ in corrected] + list(suggestions)
+
+    # города проверяем одновременно, общий лимит OWM соблюдается в weather
+    resolved = await resolve_cities(checked)
+    resolved = {city: result for city, result in resolved.items() if result}
+    found.extend((city, official) for city, (official, _owm_id) in resolved.items())
+    found.extend((city, official) for city, official in corrected if city not in resolved)
+    await remember_cities([(city, official, owm_id) for city, (official, owm_id) in resolved.items()])
+
+    suggestions = {city: variants for city, variants in suggestions.items() if city not in resolved}
+    not_found = [c for c in not_found if c not in dict(found)]
+
+    hint = format_suggestions(suggestions)
 
     if found:
+        if hint:
+            await message.answer(f"<b>{hint}</b>", parse_mode="HTML")
         await set_pagination_state(state, found, page=1)
         await show_cities_page(message, state)
     else:
         not_found_list = ", ".join(not_found) if not_found else "указанные"
         kb = get_back_keyboard()
-        await message.answer(f"<b>❌ Таких городов, как {not_found_list}, нет\n\n✍️ Попробуйте снова ввести название города или городов через запятую:</b>", reply_markup=kb, parse_mode="HTML")
+        hint_block = f"{hint}\n\n" if hint else ""
+        await message.answer(f"<b>❌ Таких городов, как {not_found_list}, нет\n\n{hint_block}✍️ Попробуйте снова ввести название города или городов через запятую:</b>", reply_markup=kb, parse_mode="HTML")
+
+
+def format_suggestions(suggestions: dict) -> str:
+    """Текст "возможно, вы имели в виду" для неоднозначных опечаток."""
+    if not suggestions:
+        return ""
+    lines = [f"• {city} → {' / '.join(variants)}" for city, variants in suggestions.items()]
+    return "🤔 Возможно, вы имели в виду:\n" + "\n".join(lines)
 
 
 async def show_cities_page(message: Message | CallbackQuery, state: FSMContext):
@@ -150,16 +241,16 @@ async def show_cities_page(message: Message | CallbackQuery, state: FSMContext):
             await message.message.edit_text(text_out, reply_markup=kb, parse_mode="HTML")
         return
 
-    ITEMS_PER_PAGE = 4
     total_pages = (len(cities) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
     current_page = max(1, min(current_page, total_pages))
 
-    start_idx = (current_page - 1) * ITEMS_PER_PAGE
-    end_idx = start_idx + ITEMS_PER_PAGE
-    page_cities = cities[start_idx:end_idx]
+    page_cities = get_page(cities, current_page)
 
     city_official_list = [official for (user_city, official) in page_cities]
+    warm = is_cached(city_official_list)
+    started = time.perf_counter()
     weather_labels = await get_weather_label_parallel(city_official_list)
+    prefetcher.record_flip(warm, time.perf_counter() - started)
 
     weather_buttons = []
     for (user_city, official_city), label in zip(page_cities, weather_labels):
@@ -193,6 +284,17 @@ async def show_cities_page(message: Message | CallbackQuery, state: FSMContext):
     else:
         await message.message.edit_text(text_out, reply_markup=weather_kb, parse_mode="HTML")
 
+    # прогреваем кэш соседних страниц, пока пользователь смотрит текущую
+    if total_pages > 1:
+        neighbours = {prev_page, next_page} - {current_page}
+        prefetch_cities = [official for page in sorted(neighbours) for (_user_city, official) in get_page(cities, page)]
+        prefetcher.schedule(message.from_user.id, prefetch_cities)
+
+
+def get_page(cities: list, page: int) -> list:
+    start_idx = (page - 1) * ITEMS_PER_PAGE
+    return cities[start_idx:start_idx + ITEMS_PER_PAGE]
+
 
 @router.callback_query(StateFilter(States.waiting_for_cities), lambda c: c.data.startswith("action=page"))
 async def handle_pagination(query: CallbackQuery, state: FSMContext):
@@ -214,17 +316,33 @@ async def callback_details(query: CallbackQuery, state: FSMContext):
     
     info = await get_detailed_weather(city_name)
 
+    rows = [[InlineKeyboardButton(text="🔙 Вернуться", callback_data=f"action=page&page={return_page}")]]
+    forecast_data = f"action=forecast&city={city_name}&page={return_page}"
+    if len(forecast_data.encode()) <= CALLBACK_DATA_LIMIT:
+        rows.insert(0, [InlineKeyboardButton(text="📅 Прогноз на 5 дней", callback_data=forecast_data)])
+    kb = InlineKeyboardMarkup(inline_keyboard=rows)
+    await query.message.edit_text(info, reply_markup=kb)
+
+    await query.answer()
+
+
+@router.callback_query(StateFilter(States.waiting_for_cities), lambda c: c.data.startswith("action=forecast"))
+async def callback_forecast(query: CallbackQuery, state: FSMContext):
+    await query.answer()
+
+    data = dict(param.split("=") for param in query.data.split("&"))
+    city_name = data["city"]
+    return_page = int(data["page"])
+
+    forecast = await get_forecast(city_name)
+
     kb = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(
-                text="🔙 Вернуться",
-                callback_data=f"action=page&page={return_page}"
-            )]
+            [InlineKeyboardButton(text="🌡 Погода сейчас", callback_data=f"action=details&city={city_name}&page={return_page}")],
+            [InlineKeyboardButton(text="🔙 Вернуться", callback_data=f"action=page&page={return_page}")],
         ]
     )
-    await query.message.edit_text(info, reply_markup=kb)
-
-    await query.answer()
+    await query.message.edit_text(format_forecast(city_name, forecast), reply_markup=kb)
 
 
 @router.callback_query(StateFilter(States.waiting_for_cities), lambda c: c.data.startswith("action=none"))
@@ -232,12 +350,107 @@ async def callback_none(query: CallbackQuery):
     await query.answer()
 
 
+@router.callback_query(F.data == "sub=add")
+async def callback_subscribe_add(query: CallbackQuery, state: FSMContext):
+    await query.answer()
+    prefetcher.cancel(query.from_user.id)
+    await state.set_state(SubscribeStates.waiting_for_city)
+    await query.message.edit_text(
+        "<b>✍️ Введите название города для ежедневной погоды</b>",
+        reply_markup=get_back_keyboard(),
+        parse_mode="HTML",
+    )
+
+
+@router.callback_query(F.data.startswith("sub=del"))
+async def callback_subscribe_delete(query: CallbackQuery):
+    data = dict(param.split("=") for param in query.data.split("&"))
+    deleted = await delete_subscription(query.from_user.id, int(data["id"]))
+    await query.answer("Подписка удалена" if deleted else "Подписка уже удалена")
+    await show_subscriptions(query.message, query.from_user.id, edit=True)
+
+
+@router.message(StateFilter(SubscribeStates.waiting_for_city))
+async def process_subscribe_city(message: Message, state: FSMContext):
+    user_text = (message.text or "").strip()
+    await log_query(message.from_user.id, user_text)
+
+    found, not_found = await find_cities_in_db([user_text])
+    city = found[0][1] if found else None
+    if city is None:
+        # исправление опечатки — только если OWM не знает набранного названия
+        resolved = await resolve_city(user_text)
+        if resolved:
+            city, owm_id = resolved
+            await remember_cities([(user_text, city, owm_id)])
+        else:
+            corrected, _suggestions, _unknown = match_fuzzy(not_found)
+            city = corrected[0][1] if corrected else None
+
+    # смещение часового пояса города берём из ответа OWM
+    data = await get_weather(city) if city else None
+    if not data or not data.ok:
+        await message.answer(
+            f"<b>❌ Город {user_text} не найден\n\n✍️ Попробуйте ввести название ещё раз:</b>",
+            reply_markup=get_back_keyboard(),
+            parse_mode="HTML",
+        )
+        return
+
+    await state.update_data(sub_city=city, sub_offset=data.timezone)
+    await state.set_state(SubscribeStates.waiting_for_time)
+    await message.answer(
+        f"<b>🕗 Во сколько присылать погоду в {city}?\n\n"
+        "👉 Введите местное время города в формате ЧЧ:ММ, например</b> <code>08:00</code>",
+        reply_markup=get_back_keyboard(),
+        parse_mode="HTML",
+    )
+
+
+@router.message(StateFilter(SubscribeStates.waiting_for_time))
+async def process_subscribe_time(message: Message, state: FSMContext):
+    match = TIME_RE.match((message.text or "").strip())
+    if not match:
+        await message.answer(
+            "<b>❌ Не понял время\n\n👉 Введите его в формате ЧЧ:ММ, например</b> <code>08:00</code>",
+            reply_markup=get_back_keyboard(),
+            parse_mode="HTML",
+        )
+        return
+
+    send_time = f"{int(match.group(1)):02d}:{match.group(2)}"
+    data = await state.get_data()
+    user_id = message.from_user.id
+    subs = await list_subscriptions(user_id)
+    if len(subs) >= SUBSCRIPTIONS_LIMIT and all(city != data["sub_city"] for _id, city, _time in subs):
+        await state.clear()
+        await message.answer(f"<b>❌ Можно подписаться не больше чем на {SUBSCRIPTIONS_LIMIT} городов</b>", parse_mode="HTML")
+        return
+
+    await register_user_if_not_exists(user_id)
+    await add_subscription(user_id, data["sub_city"], send_time, data["sub_offset"])
+    await state.clear()
+    await message.answer(f"<b>✅ Погода в {data['sub_city']} будет приходить каждый день в {send_time}</b>", parse_mode="HTML")
+    await show_subscriptions(message, user_id)
+
+
+@router.inline_query()
+async def inline_weather(inline_query: InlineQuery):
+    """Погода прямо в любом чате: @бот Моск."""
+    results, cache_time = await inline_search.answer(inline_query.query)
+    # результаты зависят только от текста запроса — Telegram может отдавать их всем из своего кэша
+    await inline_query.answer(
+        results,
+        cache_time=cache_time,
+        is_personal=False,
+        button=None if results else InlineQueryResultsButton(text="🔎 Город не найден — открыть бота", start_parameter="inline"),
+    )
 
 
 @router.message()
 async def fallback_text(message: Message, state: FSMContext):
     user_id = message.from_user.id
     user_text = message.text.strip()
-    log_query(user_id, user_text)
+    await log_query(user_id, user_text)
 
     await message.answer("Пожалуйста, используйте кнопки или введите /start, чтобы вернуться в меню.")
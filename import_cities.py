@@ -0,0 +1,294 @@
+"""
+Заполнение таблицы citys из списка городов OWM (JSON-массив или JSON Lines,
+можно в gzip). Файл читается потоком, в памяти держится только текущая пачка строк.
+Повторный запуск меняет только новые города, новые алиасы и пустые owm_id;
+алиасы, накопленные ботом, сохраняются.
+
+Нужен список с переводами названий в поле langs: официальным становится
+русское название, как его возвращает OWM с lang=ru. В стандартном
+city.list.json.gz переводов нет — такой файл отклоняется, если среди первых
+LANGS_CHECK записей нет ни одного русского названия. С --allow-no-langs
+он всё же загружается: названия останутся английскими и не совпадут
+с ответами OWM, русский ввод будет находить только грубая обратная транслитерация.
+
+    python import_cities.py city.list.json.gz [--prefer RU,UA,BY,KZ] [--db weather_bot.db] [--allow-no-langs]
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+
+import database
+from database import run_db
+from utils import normalize_city
+
+IMPORT_BATCH = 20000
+READ_CHUNK = 1 << 20
+PROGRESS_EVERY = 50000
+LANGS_CHECK = 10000  # записей, среди которых должно найтись русское название
+# страны, где названия в латинице — транслитерация с кириллицы
+CYRILLIC_COUNTRIES = {"RU", "UA", "BY", "KZ", "KG"}
+
+SQL_STAGE_CREATE = """
+    CREATE TEMP TABLE city_import (
+        name TEXT NOT NULL,
+        aliases TEXT NOT NULL,
+        owm_id INTEGER,
+        rank INTEGER NOT NULL
+    )
+"""
+SQL_STAGE_INSERT = "INSERT INTO city_import (name, aliases, owm_id, rank) VALUES (?, ?, ?, ?)"
+# из одноимённых городов берётся один: сначала предпочтительные страны, затем меньший id
+SQL_DIFF_CREATE = """
+    CREATE TEMP TABLE city_import_diff AS
+    SELECT s.name, s.aliases, s.owm_id, c.id AS row_id, c.aliases AS old_aliases, c.owm_id AS old_owm_id
+    FROM (
+        SELECT name, aliases, owm_id,
+               ROW_NUMBER() OVER (PARTITION BY name ORDER BY rank, owm_id) AS rn
+        FROM city_import
+    ) s
+    LEFT JOIN citys c ON c.name = s.name
+    WHERE s.rn = 1
+"""
+SQL_DIFF_PAGE = """
+    SELECT rowid, name, aliases, owm_id, row_id, old_aliases, old_owm_id
+    FROM city_import_diff WHERE rowid > ? ORDER BY rowid LIMIT ?
+"""
+SQL_CITY_INSERT = "INSERT INTO citys (name, aliases, owm_id) VALUES (?, ?, ?)"
+SQL_CITY_UPDATE = "UPDATE citys SET aliases = ?, owm_id = ? WHERE id = ?"
+
+_TRANSLIT = {
+    "shch": "щ", "zh": "ж", "kh": "х", "ts": "ц", "ch": "ч", "sh": "ш",
+    "yu": "ю", "ya": "я", "yo": "ё", "ye": "е", "iy": "ий", "yy": "ый",
+    "a": "а", "b": "б", "c": "к", "d": "д", "e": "е", "f": "ф", "g": "г", "h": "х",
+    "i": "и", "j": "й", "k": "к", "l": "л", "m": "м", "n": "н", "o": "о", "p": "п",
+    "q": "к", "r": "р", "s": "с", "t": "т", "u": "у", "v": "в", "w": "в", "x": "кс",
+    "y": "ы", "z": "з", "'": "ь",
+}
+_TRANSLIT_RE = re.compile("|".join(sorted(_TRANSLIT, key=len, reverse=True)))
+_LATIN_NAME_RE = re.compile(r"^[A-Za-z' -]+$")
+
+
+def _cyrillic(match: re.Match) -> str:
+    # "e" в начале слова — "э" (Elista -> Элиста)
+    start = match.start()
+    if match.group() == "e" and (start == 0 or not match.string[start - 1].isalpha()):
+        return "э"
+    return _TRANSLIT[match.group()]
+
+
+def transliterate(name: str) -> str:
+    """Обратная транслитерация латинского названия в кириллицу (Volzhskiy -> Волжский)."""
+    text = _TRANSLIT_RE.sub(_cyrillic, name.lower())
+    return " ".join(word[:1].upper() + word[1:] for word in text.split(" "))
+
+
+def strip_accents(name: str) -> str:
+    return "".join(ch for ch in unicodedata.normalize("NFKD", name) if not unicodedata.combining(ch))
+
+
+def _langs(record: dict) -> dict:
+    """Переводы названия: [{"ru": "Москва"}, ...] или {"ru": "Москва"}."""
+    langs = record.get("langs") or {}
+    if isinstance(langs, list):
+        merged = {}
+        for item in langs:
+            if isinstance(item, dict):
+                merged.update(item)
+        langs = merged
+    return langs
+
+
+def city_row(record: dict) -> tuple[str, str, int | None, str] | None:
+    """
+    (официальное название, алиасы через запятую, id в OWM, страна) по записи списка.
+    Официальное название — русское, как его возвращает OWM с lang=ru;
+    алиасы — английское и исходное написание, без диакритики и обратная транслитерация.
+    """
+    name = " ".join(str(record.get("name") or "").replace(",", " ").split())
+    if not name:
+        return None
+    country = (record.get("country") or "").upper()
+    langs = _langs(record)
+    ru = " ".join(str(langs.get("ru") or "").replace(",", " ").split())
+    official = ru or name
+    variants = [name, str(langs.get("en") or ""), strip_accents(name)]
+    if not ru and country in CYRILLIC_COUNTRIES and _LATIN_NAME_RE.match(name):
+        variants.append(transliterate(name))
+    seen = {normalize_city(official)}
+    aliases = []
+    for variant in variants:
+        variant = " ".join(variant.replace(",", " ").split())
+        key = normalize_city(variant)
+        if key and key not in seen:
+            seen.add(key)
+            aliases.append(variant)
+    return official, ", ".join(aliases), record.get("id"), country
+
+
+def iter_records(path: str):
+    """Записи JSON-массива или JSON Lines по одной, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,[]":
+                pos += 1
+            if pos < len(buf):
+                try:
+                    record, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield record
+                    continue
+            elif eof:
+                return
+            # запись оборвана на границе блока — дочитываем
+            chunk = f.read(READ_CHUNK)
+            buf = buf[pos:] + chunk
+            pos = 0
+            eof = not chunk
+
+
+def _merge_aliases(name: str, old: str | None, new: str) -> str:
+    """Алиасы строки citys плюс новые из списка OWM (без повторов)."""
+    old = old or ""
+    keys = {normalize_city(name)} | {normalize_city(a) for a in old.split(",")}
+    added = [a.strip() for a in new.split(",") if a.strip() and normalize_city(a) not in keys]
+    return ", ".join(a for a in (old, *added) if a)
+
+
+def _check_langs(stats: dict, allow_no_langs: bool):
+    # citys ещё не тронута: список без переводов отклоняется до записи
+    if not stats["russian"] and not allow_no_langs:
+        raise ValueError(
+            f"в первых {min(stats['read'], LANGS_CHECK)} записях нет русских названий (поле langs) — "
+            "нужен список с переводами или флаг --allow-no-langs"
+        )
+
+
+def _import(conn: sqlite3.Connection, path: str, prefer: list[str], allow_no_langs: bool) -> dict:
+    stats = {"read": 0, "skipped": 0, "russian": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+    rank_of = {country: i for i, country in enumerate(prefer)}
+    started = time.perf_counter()
+
+    # 1. поток записей -> временная таблица без индексов, большими транзакциями
+    conn.execute("DROP TABLE IF EXISTS temp.city_import")
+    conn.execute("DROP TABLE IF EXISTS temp.city_import_diff")
+    conn.execute(SQL_STAGE_CREATE)
+    batch = []
+    for record in iter_records(path):
+        stats["read"] += 1
+        row = city_row(record)
+        if row is not None:
+            stats["russian"] += bool(_langs(record).get("ru"))
+        # проверка до пропуска: запись номер LANGS_CHECK может оказаться без названия
+        if stats["read"] == LANGS_CHECK:
+            _check_langs(stats, allow_no_langs)
+        if row is None:
+            stats["skipped"] += 1
+            continue
+        official, aliases, owm_id, country = row
+        batch.append((official, aliases, owm_id, rank_of.get(country, len(prefer))))
+        if len(batch) >= IMPORT_BATCH:
+            with conn:
+                conn.executemany(SQL_STAGE_INSERT, batch)
+            batch = []
+        if stats["read"] % PROGRESS_EVERY == 0:
+            elapsed = time.perf_counter() - started
+            print(f"  прочитано {stats['read']} ({stats['read'] / elapsed:,.0f} строк/с)", file=sys.stderr)
+    if stats["read"] < LANGS_CHECK:
+        _check_langs(stats, allow_no_langs)
+    with conn:
+        conn.executemany(SQL_STAGE_INSERT, batch)
+    read_time = time.perf_counter() - started
+
+    # 2. индекс и сравнение с citys — после загрузки
+    conn.execute("CREATE INDEX temp.idx_city_import_name ON city_import(name, rank, owm_id)")
+    conn.execute(SQL_DIFF_CREATE)
+    initial = conn.execute("SELECT NOT EXISTS (SELECT 1 FROM citys)").fetchone()[0]
+    if initial:
+        # первая загрузка: индекс по названию строится один раз после вставки
+        conn.execute("DROP INDEX IF EXISTS idx_citys_name")
+
+    # 3. только изменения: новые города, новые алиасы, пустой owm_id
+    last = 0
+    while True:
+        rows = conn.execute(SQL_DIFF_PAGE, (last, IMPORT_BATCH)).fetchall()
+        if not rows:
+            break
+        last = rows[-1][0]
+        inserts = []
+        updates = []
+        for _rowid, name, aliases, owm_id, row_id, old_aliases, old_owm_id in rows:
+            if row_id is None:
+                inserts.append((name, aliases, owm_id))
+                continue
+            # id, найденный ботом через API, точнее одноимённого города из списка
+            merged = _merge_aliases(name, old_aliases, aliases)
+            new_owm_id = old_owm_id or owm_id
+            if merged != (old_aliases or "") or new_owm_id != old_owm_id:
+                updates.append((merged, new_owm_id, row_id))
+            else:
+                stats["unchanged"] += 1
+        with conn:
+            conn.executemany(SQL_CITY_INSERT, inserts)
+            conn.executemany(SQL_CITY_UPDATE, updates)
+        stats["inserted"] += len(inserts)
+        stats["updated"] += len(updates)
+
+    if initial:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_citys_name ON citys(name)")
+    conn.execute("DROP TABLE temp.city_import_diff")
+    conn.execute("DROP TABLE temp.city_import")
+    stats["read_seconds"] = read_time
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+async def run(path: str, prefer: list[str], allow_no_langs: bool = False) -> dict:
+    try:
+        return await run_db(_import, path, prefer, allow_no_langs)
+    finally:
+        await database.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт списка городов OWM в таблицу citys")
+    parser.add_argument("path", help="city.list.json.gz или JSON Lines")
+    parser.add_argument("--prefer", default="RU,UA,BY,KZ", help="страны, выигрывающие у одноимённых городов")
+    parser.add_argument("--db", default=database.DB_NAME, help="файл БД")
+    parser.add_argument("--allow-no-langs", action="store_true", help="загружать список без русских названий")
+    args = parser.parse_args()
+
+    database.DB_NAME = args.db
+    database.create_tables()
+    prefer = [c.strip().upper() for c in args.prefer.split(",") if c.strip()]
+    try:
+        stats = asyncio.run(run(args.path, prefer, args.allow_no_langs))
+    except ValueError as e:
+        sys.exit(f"ошибка: {e}")
+
+    written = stats["inserted"] + stats["updated"]
+    print(f"прочитано:  {stats['read']} записей за {stats['read_seconds']:.1f} с "
+          f"({stats['read'] / (stats['read_seconds'] or 1):,.0f} строк/с), пропущено {stats['skipped']}")
+    if stats["russian"] < stats["read"] - stats["skipped"]:
+        print(f"внимание:   без русского названия {stats['read'] - stats['skipped'] - stats['russian']} записей",
+              file=sys.stderr)
+    print(f"добавлено:  {stats['inserted']}, обновлено: {stats['updated']}, без изменений: {stats['unchanged']}")
+    print(f"всего:      {stats['seconds']:.1f} с ({stats['read'] / (stats['seconds'] or 1):,.0f} записей/с, "
+          f"{written / (stats['seconds'] or 1):,.0f} записанных строк/с)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import time
+import zlib
+from collections import Counter
+
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+from dotenv import load_dotenv
+
+from analytics import query_rollup
+from city_index import city_index
+from render import format_detailed_weather, format_weather_label, render_cache
+from scheduler import Priority
+from utils import normalize_city
+from weather import cached_weather, get_weather_many
+from weather_model import Weather
+
+load_dotenv()
+
+INLINE_RESULTS = int(os.getenv("INLINE_RESULTS", "8"))
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", "0.3"))  # пауза перед запросом к OWM, с
+INLINE_FETCH_TIMEOUT = float(os.getenv("INLINE_FETCH_TIMEOUT", "2"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "60"))  # кэш ответа на стороне Telegram, с
+INLINE_PARTIAL_CACHE_TIME = 5  # для ответа, где не всем городам хватило данных
+INLINE_SCAN = 200  # кандидатов по префиксу до ранжирования
+POPULAR_HOURS = 24 * 7
+POPULAR_TTL = 300
+
+
+def _article(city_name: str, data: Weather) -> InlineQueryResultArticle:
+    return InlineQueryResultArticle(
+        id=f"{data.id or zlib.crc32(city_name.encode())}-{int(data.fetched_at)}",
+        title=format_weather_label(city_name, data),
+        description=f"{data.description}, ощущается как {data.feels_like:g}°C, ветер {data.wind_speed:g} м/с",
+        input_message_content=InputTextMessageContent(
+            message_text=format_detailed_weather(city_name, data), parse_mode="HTML",
+        ),
+    )
+
+
+class InlineSearch:
+    """
+    Ответы на inline-запросы "@бот Моск" по мере набора.
+    Кандидаты — поиск по началу алиаса в индексе городов (при опечатке —
+    нечёткий поиск), выше — точное совпадение, города с погодой в кэше
+    и популярные за неделю (по агрегатам запросов). Если у всех городов
+    есть данные в кэше, ответ уходит сразу и без запросов к OWM.
+    Иначе запрос ждёт INLINE_DEBOUNCE секунд: следующий символ от того же
+    пользователя отменяет его (ThrottlingMiddleware), так что к OWM идут
+    только после паузы в наборе. Начатая загрузка не отменяется
+    и заполняет общий кэш для следующих запросов.
+    """
+
+    def __init__(self):
+        self._popular: dict[str, int] = {}
+        self._popular_at = -POPULAR_TTL
+        self._popular_task: asyncio.Task | None = None
+        self.counts = Counter()
+
+    def candidates(self, query: str) -> list[str]:
+        self._refresh_popular()
+        prefix = normalize_city(query)
+        if not prefix:
+            names = list(self._popular)
+        else:
+            names = city_index.complete(prefix, INLINE_SCAN)
+            if not names and len(prefix) >= 3:
+                _official, names = city_index.correct(prefix)
+        popular = self._popular
+
+        def rank(name: str) -> tuple:
+            return (normalize_city(name) != prefix, cached_weather(name) is None, -popular.get(name, 0), len(name), name)
+
+        return sorted(names, key=rank)[:INLINE_RESULTS]
+
+    async def answer(self, query: str) -> tuple[list[InlineQueryResultArticle], int]:
+        """Результаты и cache_time для ответа на запрос."""
+        self.counts["queries"] += 1
+        cities = self.candidates(query)
+        data = {city: cached_weather(city) for city in cities}
+        missing = [city for city, weather in data.items() if weather is None]
+        if missing:
+            await asyncio.sleep(INLINE_DEBOUNCE)
+            self.counts["fetched"] += 1
+            try:
+                fetched = await asyncio.wait_for(get_weather_many(missing, Priority.INTERACTIVE), INLINE_FETCH_TIMEOUT)
+                data.update(zip(missing, fetched))
+            except asyncio.TimeoutError:
+                self.counts["timeouts"] += 1
+        elif cities:
+            self.counts["instant"] += 1
+
+        results = [
+            render_cache.get_or_render("inline", city, weather, _article)
+            for city, weather in data.items() if weather is not None and weather.ok
+        ]
+        complete = all(weather is not None and weather.ok and not weather.stale for weather in data.values())
+        return results, INLINE_CACHE_TIME if complete else INLINE_PARTIAL_CACHE_TIME
+
+    def _refresh_popular(self):
+        if time.monotonic() - self._popular_at < POPULAR_TTL:
+            return
+        if self._popular_task is None or self._popular_task.done():
+            self._popular_task = asyncio.create_task(self._load_popular())
+
+    async def _load_popular(self):
+        try:
+            self._popular = dict(await query_rollup.top_cities(POPULAR_HOURS, INLINE_SCAN))
+        except Exception as e:
+            logging.warning(f"Не удалось загрузить популярные города для inline-режима: {e}")
+        self._popular_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return dict(self.counts)
+
+
+inline_search = InlineSearch()
@@ -12,6 +12,7 @@ main_menu = ReplyKeyboardMarkup(
             KeyboardButton(text="🌡 Посмотреть температуру городов"),
         ],
         [
+            KeyboardButton(text="🔔 Подписки"),
             KeyboardButton(text="👤 Мой профиль")
         ]
     ],
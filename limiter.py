@@ -0,0 +1,78 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class PrioritySemaphore:
+    """
+    Семафор с приоритетами: освободившийся слот получает ожидающий
+    с наименьшим значением priority, при равенстве — пришедший раньше.
+    """
+
+    def __init__(self, value: int):
+        self._free = value
+        self._waiters: list = []  # (priority, seq, future)
+        self._seq = itertools.count()
+
+    def waiting(self) -> int:
+        return sum(1 for _p, _s, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int = 0):
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # слот успели выдать, но ожидающего отменили — отдаём следующему
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _priority, _seq, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._free += 1
+
+
+class TokenBucket:
+    """
+    Токен-бакет: rate токенов в секунду, не более capacity подряд.
+    acquire() ждёт токен, ожидающие обслуживаются по приоритету.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._gate = PrioritySemaphore(1)
+        self.waits = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Забрать токены без ожидания."""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1, priority: int = 0):
+        await self._gate.acquire(priority)
+        try:
+            while not self.try_acquire(tokens):
+                self.waits += 1
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+        finally:
+            self._gate.release()
@@ -2,30 +2,119 @@ import logging
 import os
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
-from database import create_tables
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from database import create_tables, close_db, write_queue
+from city_index import city_index
 from middlewares.log_middleware import LoggingMiddleware
+from middlewares.throttle_middleware import ThrottlingMiddleware
+from middlewares.metrics_middleware import HandlerTimingMiddleware, TelegramTimingMiddleware
 from handlers import router
-from weather import close_session  # Импортируем функцию закрытия сессии
+from weather import close_session, get_cache_stats, weather_cache  # Импортируем функцию закрытия сессии
+from scheduler import scheduler
+from prefetch import prefetcher
+from render import render_cache
+from popular import popular_refresher
+from analytics import query_rollup
+from inline import inline_search
+from delivery import DeliveryScheduler
+from weather_store import weather_store
+from logging_setup import setup_logging
+from webhook import is_primary_worker, run_webhook, worker_count
+from fsm_storage import create_storage
+from metrics import registry, start_metrics_server
 
-logging.basicConfig(level=logging.INFO)
+log_listener = setup_logging()  # JSON-логи через QueueHandler, вывод в отдельном потоке
 load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')  # свой Bot API сервер или локальная заглушка
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling | webhook
 
-bot = Bot(token=TELEGRAM_BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
-storage = MemoryStorage()
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=TELEGRAM_BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+bot.session.middleware(TelegramTimingMiddleware())
+storage = create_storage()  # FSM_STORAGE: sqlite (по умолчанию), redis или memory
 dp = Dispatcher(storage=storage)
 
-dp.update.middleware(LoggingMiddleware(bot))
+delivery = DeliveryScheduler(bot)
+logging_middleware = LoggingMiddleware(bot)
+dp.update.middleware(logging_middleware)
+throttling_middleware = ThrottlingMiddleware()
+dp.update.middleware(throttling_middleware)  # после логирования: в лог попадают и отклонённые нажатия
+router.message.middleware(HandlerTimingMiddleware())
+router.callback_query.middleware(HandlerTimingMiddleware())
+router.inline_query.middleware(HandlerTimingMiddleware())
 
+# значения, считываемые при выдаче /metrics
+registry.counter("weather_cache_hits_total", "Попадания в кэш погоды", lambda: weather_cache.hits)
+registry.counter("weather_cache_misses_total", "Промахи кэша погоды", lambda: weather_cache.misses)
+registry.gauge(
+    "weather_cache_hit_ratio", "Доля попаданий в кэш погоды",
+    lambda: weather_cache.hits / ((weather_cache.hits + weather_cache.misses) or 1),
+)
+registry.gauge("weather_cache_size", "Записей в кэше погоды", lambda: weather_cache.stats()["size"])
+registry.gauge("owm_queue_depth", "Запросы к OWM в ожидании слота", scheduler.queue_depth)
+registry.counter("owm_retries_total", "Повторы запросов к OWM", lambda: scheduler.retries)
+registry.gauge("db_write_queue_depth", "Строки в очереди записи в БД", write_queue.qsize)
+registry.counter("db_write_dropped_total", "Отброшенные строки очереди записи", lambda: write_queue.dropped)
+registry.gauge("admin_log_queue_depth", "События в очереди лог-бота", logging_middleware.qsize)
+registry.counter("admin_log_dropped_total", "Отброшенные события лог-бота", lambda: logging_middleware.dropped)
+registry.gauge("delivery_queue_depth", "Сообщения рассылки в очереди отправки", delivery.qsize)
+registry.gauge("prefetch_active", "Активные задачи предзагрузки страниц", lambda: prefetcher.stats()["active"])
+registry.counter(
+    "throttle_rejected_total", "Отклонённые троттлингом события",
+    lambda: sum(v for k, v in throttling_middleware.counts.items() if k != "passed"),
+)
+registry.counter("query_rollup_rows_total", "Строки query_logs, учтённые в агрегатах", lambda: query_rollup.processed)
+registry.counter("query_logs_archived_total", "Строки query_logs, перенесённые в архив", lambda: query_rollup.archived)
+registry.counter("inline_queries_total", "Inline-запросы", lambda: inline_search.counts["queries"])
+registry.counter("inline_instant_total", "Inline-ответы целиком из кэша", lambda: inline_search.counts["instant"])
+registry.counter("inline_fetched_total", "Inline-ответы с загрузкой погоды", lambda: inline_search.counts["fetched"])
+metrics_runner = None
 
-async def on_shutdown(dp: Dispatcher):
+
+async def on_startup(dispatcher: Dispatcher):
+    """Запуск фоновых задач."""
+    global metrics_runner
+    metrics_runner = await start_metrics_server()
+    scheduler.share_quota(worker_count())  # процессы вебхука делят квоту OWM
+    write_queue.start()
+    await city_index.load()
+    logging.info("Индекс городов загружен: %s алиасов", len(city_index))
+    if not is_primary_worker():
+        return
+    # задачи в одном экземпляре на все процессы вебхука
+    await weather_store.prune()
+    query_rollup.start()  # агрегаты запросов и архивация старых логов
+    popular_refresher.start()  # заранее обновляем погоду самых запрашиваемых городов
+    delivery.start()  # ежедневная рассылка по подпискам
+
+
+async def on_shutdown(dispatcher: Dispatcher):
     """Закрытие сессий при завершении работы бота."""
     logging.info("Бот завершает работу...")
+    logging.info("Статистика кэша погоды: %s", get_cache_stats())
+    logging.info("Статистика кэша текстов: %s", render_cache.stats())
+    logging.info("Статистика запросов к OWM: %s", scheduler.stats())
+    logging.info("Статистика предзагрузки страниц: %s", prefetcher.stats())
+    logging.info("Статистика троттлинга: %s", throttling_middleware.stats())
+    logging.info("Inline-запросы: %s", inline_search.stats())
+    logging.info("Обновление популярных городов: %s", popular_refresher.stats())
+    await popular_refresher.stop()
+    await query_rollup.stop()
+    logging.info("Агрегация запросов: %s", query_rollup.stats())
+    await delivery.stop()
+    logging.info("Рассылка по подпискам: %s", delivery.stats())
     await close_session()  
+    await write_queue.stop()  # дописываем логи из очереди до закрытия БД
+    logging.info("Очередь записи: записано %s, отброшено %s", write_queue.written, write_queue.dropped)
+    await close_db()
+    await logging_middleware.stop()  # досылаем накопленные логи админу
     await bot.session.close()  
+    if metrics_runner:
+        await metrics_runner.cleanup()
     logging.info("Все сессии закрыты.")
 
 # запуск бота
@@ -33,12 +122,17 @@ def main():
     create_tables()  # cоздаём таблицы в БД
     dp.include_router(router)  # подключаем маршруты
     
-    # регистрируем обработчик завершения
+    # регистрируем обработчики запуска и завершения
+    dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
     
-    # запускаем бота в режиме polling
     logging.info("Бот запущен!")
-    dp.run_polling(bot, skip_updates=True)
+    if BOT_MODE == "webhook":
+        run_webhook(dp, bot)
+    else:
+        # запускаем бота в режиме polling
+        dp.run_polling(bot, skip_updates=True)
+    log_listener.stop()  # дописываем оставшиеся записи логов
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,150 @@
+import logging
+import os
+from bisect import bisect_left
+from typing import Callable
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 0 — не поднимать /metrics
+
+# границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_worker = 0  # номер процесса вебхука: у каждого свой порт METRICS_PORT + номер
+
+
+def set_worker(index: int):
+    global _worker
+    _worker = index
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _HistogramChild:
+    """Счётчики одной серии: список корзин создаётся один раз, observe() только прибавляет."""
+    __slots__ = ("bounds", "buckets", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram:
+    """
+    Гистограмма с одной меткой. Без блокировок: каждую метрику пишет
+    один поток (event loop или поток БД), чтение при выдаче /metrics
+    может отстать на одно наблюдение.
+    """
+
+    def __init__(self, name: str, help_text: str, label: str, bounds: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.bounds = bounds
+        self._children: dict = {}
+
+    def labels(self, value) -> _HistogramChild:
+        child = self._children.get(value)
+        if child is None:
+            child = self._children[value] = _HistogramChild(self.bounds)
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, child in list(self._children.items()):
+            label = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, count in zip(self.bounds, child.buckets):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{_fmt(bound)}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {child.count}')
+            lines.append(f"{self.name}_sum{{{label}}} {child.sum!r}")
+            lines.append(f"{self.name}_count{{{label}}} {child.count}")
+        return lines
+
+
+class _Callback:
+    """Значение, которое считывается из объекта бота в момент выдачи /metrics."""
+
+    def __init__(self, name: str, help_text: str, kind: str, func: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.func = func
+
+    def render(self) -> list[str]:
+        try:
+            value = self.func()
+        except Exception as e:
+            logging.warning("Метрика %s не считана: %s", self.name, e)
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", f"{self.name} {_fmt(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def histogram(self, name: str, help_text: str, label: str, bounds: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, label, bounds)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, func: Callable[[], float]):
+        self._metrics.append(_Callback(name, help_text, "gauge", func))
+
+    def counter(self, name: str, help_text: str, func: Callable[[], float]):
+        self._metrics.append(_Callback(name, help_text, "counter", func))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+OWM_REQUEST_SECONDS = registry.histogram(
+    "owm_request_seconds", "Время запроса к OpenWeatherMap по статусу ответа", "status"
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_seconds", "Время выполнения функции в потоке БД", "func"
+)
+HANDLER_SECONDS = registry.histogram(
+    "handler_seconds", "Время обработчика Telegram-обновления", "route"
+)
+TELEGRAM_REQUEST_SECONDS = registry.histogram(
+    "telegram_request_seconds", "Время вызова Bot API по методу", "method"
+)
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server() -> web.AppRunner | None:
+    """Отдельный HTTP-сервер с GET /metrics в формате Prometheus."""
+    if not METRICS_PORT:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = METRICS_PORT + _worker
+    await web.TCPSite(runner, METRICS_HOST, port).start()
+    logging.info("Метрики доступны на http://%s:%s/metrics", METRICS_HOST, port)
+    return runner
@@ -1,27 +1,62 @@
 import logging
 import asyncio
+import html
 from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import Update
 from aiogram import Bot
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "1000"))
+LOG_BATCH_EVENTS = int(os.getenv("LOG_BATCH_EVENTS", "20"))
+LOG_BATCH_INTERVAL = float(os.getenv("LOG_BATCH_INTERVAL", "5"))
+LOG_SEND_ATTEMPTS = 3
+TELEGRAM_TEXT_LIMIT = 4096
+_STOP = object()  # метка остановки в очереди событий
+
+# источники пользователя в Update в порядке проверки
+USER_SOURCES = (
+    "callback_query",
+    "message",
+    "inline_query",
+    "poll_answer",
+    "chat_join_request",
+    "my_chat_member",
+    "chat_member",
+)
+
 class LoggingMiddleware(BaseMiddleware):
-    _log_bot = None 
+    """
+    Пересылка событий админу через лог-бота.
+    События кладутся в ограниченную очередь, один обработчик собирает их
+    в сводки (LOG_BATCH_EVENTS событий или LOG_BATCH_INTERVAL секунд,
+    не длиннее лимита Telegram) и отправляет с учётом retry_after.
+    При переполнении очереди события отбрасываются и считаются в dropped.
+    Конфигурация читается один раз при создании, на горячем пути —
+    только DEBUG-логи с ленивыми аргументами.
+    """
+    _log_bot = None
 
     def __init__(self, main_bot: Bot):
         super().__init__()
         self.main_bot = main_bot
+        self._queue: asyncio.Queue = asyncio.Queue(LOG_QUEUE_SIZE)
+        self._consumer: asyncio.Task | None = None
+        self._pending: list[str] = []
+        self.sent = 0
+        self.dropped = 0
         self._init_log_bot()
-        logging.info("✅ LoggingMiddleware успешно инициализирована!")
+        self.admin_id = self._parse_admin(os.getenv("ADMIN"))
+        self.enabled = self._log_bot is not None and self.admin_id is not None
+        if not self.enabled:
+            logger.warning("Логирование админу отключено: отсутствует лог-бот или ADMIN")
+        logger.info("✅ LoggingMiddleware успешно инициализирована!")
         print("✅ LoggingMiddleware успешно инициализирована!")
 
     @classmethod
@@ -29,72 +64,118 @@ class LoggingMiddleware(BaseMiddleware):
         """Инициализация логирующего бота."""
         if cls._log_bot is None:
             token = os.getenv("BOT_LOG_TOKEN")
-            logging.info(f"Получен BOT_LOG_TOKEN: {'найден' if token else 'не найден'}")
+            logger.info("Получен BOT_LOG_TOKEN: %s", "найден" if token else "не найден")
             if token:
                 try:
                     cls._log_bot = Bot(token=token)
-                    logging.info("Логирующий бот успешно инициализирован.")
+                    logger.info("Логирующий бот успешно инициализирован.")
                 except Exception as e:
-                    logging.error(f"Ошибка инициализации лог-бота: {e}")
+                    logger.error("Ошибка инициализации лог-бота: %s", e)
             else:
-                logging.error("BOT_LOG_TOKEN не найден в .env!")
+                logger.error("BOT_LOG_TOKEN не найден в .env!")
 
-    async def __call__(self, handler, event: Update, data: dict):
-        logging.info("Middleware вызван для события")
-        admins = os.getenv("ADMIN")
-        logging.info(f"Проверка условий: _log_bot = {self._log_bot is not None}, admins = {admins}")
-
-        if self._log_bot and admins:
-            logging.info("Запуск фоновой задачи для обработки события")
-            asyncio.create_task(self._process_event(event))
-        else:
-            logging.warning("Логирование не запущено: отсутствует _log_bot или admins")
+    @staticmethod
+    def _parse_admin(value: str | None) -> int | None:
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            logger.error("Некорректное значение ADMIN в .env: %r", value)
+            return None
 
+    async def __call__(self, handler, event: Update, data: dict):
+        if self.enabled:
+            self._enqueue_event(event)
         return await handler(event, data)
 
-    async def _process_event(self, event: Update):
-        """Формирование логов и отправка в Telegram админу."""
-        logging.info("Начало обработки события")
+    def _enqueue_event(self, event: Update):
+        """Формирование записи лога и постановка в очередь без ожидания отправки."""
         try:
-            user_info = await self._get_user_info(event)
-            logging.info(f"Получена информация о пользователе: {user_info}")
-            if not user_info or user_info.get("is_bot"):
-                logging.info("Событие пропущено: нет пользователя или это бот")
+            user_info = self._get_user_info(event)
+            if not user_info or user_info["is_bot"]:
+                logger.debug("Событие %s пропущено: нет пользователя или это бот", event.update_id)
                 return
 
             event_type, event_data = self._get_event_data(event)
-            logging.info(f"Тип события: {event_type}, данные: {event_data}")
             if event_type == "unknown":
-                logging.info("Неизвестный тип события, пропускаем")
+                logger.debug("Событие %s неизвестного типа, пропускаем", event.update_id)
                 return
 
-            await self._send_log(user_info, event_type, event_data)
-            logging.info("Лог успешно отправлен")
+            self._ensure_consumer()
+            self._queue.put_nowait(self._format_entry(user_info, event_type, event_data))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Событие поставлено в очередь",
+                    extra={"update_id": event.update_id, "event_type": event_type, "user_id": user_info["user_id"]},
+                )
+        except asyncio.QueueFull:
+            self.dropped += 1
         except Exception as e:
-            logging.error(f"Ошибка логирования: {e}", exc_info=True)
+            logger.error("Ошибка логирования: %s", e, exc_info=True)
 
-    async def _get_user_info(self, event: Update) -> dict | None:
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_consumer(self):
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.create_task(self._consume())
+
+    async def _consume(self):
+        """Единственный отправитель: собирает события в сводки."""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            stopping = item is _STOP
+            if not stopping:
+                self._pending.append(item)
+            deadline = loop.time() + LOG_BATCH_INTERVAL
+            while not stopping and len(self._pending) < LOG_BATCH_EVENTS:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                stopping = item is _STOP
+                if not stopping:
+                    self._pending.append(item)
+            batch, self._pending = self._pending, []
+            if batch:
+                await self._send_digest(batch)
+
+    @staticmethod
+    def _split_digest(entries: list[str]) -> list[str]:
+        """Склейка записей в сообщения не длиннее лимита Telegram."""
+        messages = []
+        current = ""
+        for entry in entries:
+            entry = entry[:TELEGRAM_TEXT_LIMIT]
+            candidate = f"{current}\n\n{entry}" if current else entry
+            if len(candidate) > TELEGRAM_TEXT_LIMIT:
+                messages.append(current)
+                candidate = entry
+            current = candidate
+        if current:
+            messages.append(current)
+        return messages
+
+    async def _send_digest(self, entries: list[str]):
+        for text in self._split_digest(entries):
+            await self._send_log(text, entries=text.count("\n\n") + 1)
+
+    def _get_user_info(self, event: Update) -> dict | None:
         """Извлекаем информацию о пользователе из события."""
         user = None
-        sources = [
-            "callback_query",
-            "message",
-            "inline_query",
-            "poll_answer",
-            "chat_join_request",
-            "my_chat_member",
-            "chat_member",
-        ]
-
-        for source in sources:
+        for source in USER_SOURCES:
             if obj := getattr(event, source, None):
                 user = getattr(obj, "from_user", None)
                 if user:
-                    logging.info(f"Пользователь найден в источнике: {source}")
                     break
 
         if not user:
-            logging.warning("Пользователь не найден в событии")
             return None
 
         return {
@@ -116,31 +197,53 @@ class LoggingMiddleware(BaseMiddleware):
             return "inline", event.inline_query.query[:200]
         return "unknown", ""
 
-    async def _send_log(self, user_info: dict, event_type: str, event_data: str):
-        """Отправляем лог админу."""
+    def _format_entry(self, user_info: dict, event_type: str, event_data: str) -> str:
+        return (
+            f"👤 <b>{html.escape(user_info['name'])} (@{html.escape(user_info['username'])})</b>\n"
+            f"🆔 <code>{user_info['user_id']}</code>\n"
+            f"📩 <b>{event_type.capitalize()}</b>\n"
+            f"📝 {html.escape(event_data or 'нет данных')}\n"
+            f"⏱ {datetime.now().strftime('%H:%M:%S.%f')[:-3]}"
+        )
+
+    async def _send_log(self, message: str, entries: int = 1):
+        """Отправляем сводку админу, при флуд-контроле ждём retry_after."""
         try:
-            admin_id_str = os.getenv("ADMIN")
-            logging.info(f"Получен ADMIN из .env: {admin_id_str}")
-            if not admin_id_str:
-                raise ValueError("Переменная ADMIN не установлена в .env")
-            
-            admin_id = int(admin_id_str)
-            message = (
-                f"👤 <b>{user_info['name']} (@{user_info['username']})</b>\n"
-                f"🆔 <code>{user_info['user_id']}</code>\n"
-                f"📩 <b>{event_type.capitalize()}</b>\n"
-                f"📝 {event_data or 'нет данных'}\n"
-                f"⏱ {datetime.now().strftime('%H:%M:%S.%f')[:-3]}"
-            )
-
-            logging.info(f"Отправка сообщения админу {admin_id}: {message}")
-            await self._log_bot.send_message(
-                chat_id=admin_id,
-                text=message,
-                parse_mode="HTML",
-            )
+            for attempt in range(LOG_SEND_ATTEMPTS):
+                try:
+                    await self._log_bot.send_message(
+                        chat_id=self.admin_id,
+                        text=message,
+                        parse_mode="HTML",
+                    )
+                    self.sent += entries
+                    return
+                except TelegramRetryAfter as e:
+                    logger.warning("Флуд-контроль при отправке лога, ждём %s с", e.retry_after)
+                    await asyncio.sleep(e.retry_after)
+            self.dropped += entries
         except Exception as e:
-            logging.error(f"Ошибка отправки лога: {e}", exc_info=True)
+            self.dropped += entries
+            logger.error("Ошибка отправки лога: %s", e, exc_info=True)
+
+    async def stop(self):
+        """
+        Отправка оставшихся событий и закрытие лог-бота при завершении работы.
+        Отправитель не отменяется, иначе пропала бы сводка в процессе отправки
+        (в том числе ждущая retry_after): метка _STOP в конце очереди
+        завершает его после отправки всего, что было до неё.
+        """
+        if self._consumer and not self._consumer.done():
+            await self._queue.put(_STOP)
+            await self._consumer
+        self._consumer = None
+        batch, self._pending = self._pending, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch and self.enabled:
+            await self._send_digest(batch)
+        logger.info("Лог-события: отправлено %s, отброшено %s", self.sent, self.dropped)
+        await self.close_log_bot()
 
     @classmethod
     async def close_log_bot(cls):
@@ -148,6 +251,6 @@ class LoggingMiddleware(BaseMiddleware):
         try:
             if cls._log_bot:
                 await cls._log_bot.session.close()
-                logging.info("Сессия лог-бота закрыта")
+                logger.info("Сессия лог-бота закрыта")
         except Exception as e:
-            logging.error(f"Ошибка при закрытии сессии лог-бота: {e}")
\ No newline at end of file
+            logger.error("Ошибка при закрытии сессии лог-бота: %s", e)
@@ -0,0 +1,32 @@
+import time
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+
+from metrics import HANDLER_SECONDS, TELEGRAM_REQUEST_SECONDS
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """
+    Время обработчиков по имени функции (route).
+    Регистрируется как внутренняя middleware роутера: к этому моменту
+    обработчик уже выбран и лежит в data["handler"].
+    """
+
+    async def __call__(self, handler, event, data: dict):
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            route = data["handler"].callback.__name__
+            HANDLER_SECONDS.labels(route).observe(time.perf_counter() - start)
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    """Время вызовов Bot API по методу (SendMessage, EditMessageText, ...)."""
+
+    async def __call__(self, make_request, bot, method):
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            TELEGRAM_REQUEST_SECONDS.labels(type(method).__name__).observe(time.perf_counter() - start)
@@ -0,0 +1,122 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+from dotenv import load_dotenv
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.types import Update
+
+from limiter import TokenBucket
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))  # событий в секунду на пользователя
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", "5"))
+THROTTLE_WINDOW = float(os.getenv("THROTTLE_WINDOW", "1.0"))  # окно склейки одинаковых нажатий, с
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "10000"))
+
+# callback'и, перерисовывающие одно и то же сообщение: новое нажатие отменяет старое
+RENDER_PREFIXES = ("action=page", "action=details", "action=forecast")
+
+
+class _UserState:
+    __slots__ = ("bucket", "last_key", "last_time", "render", "inline")
+
+    def __init__(self):
+        self.bucket = TokenBucket(THROTTLE_RATE, THROTTLE_BURST)
+        self.last_key = None
+        self.last_time = 0.0
+        self.render: asyncio.Task | None = None
+        self.inline: asyncio.Task | None = None
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Защита от спама кнопками (на процесс).
+    Повтор того же сообщения или callback'а за THROTTLE_WINDOW секунд
+    склеивается с первым и не обрабатывается; сверх токен-бакета
+    пользователя события отбрасываются; новая перерисовка списка городов
+    отменяет ещё не закончившуюся предыдущую. Inline-запросы приходят
+    на каждый символ: они не склеиваются и не расходуют бакет, но новый
+    запрос отменяет незаконченный предыдущий. Каждый отказ считается в stats().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._users: OrderedDict[int, _UserState] = OrderedDict()
+        self.counts = Counter()
+
+    async def __call__(self, handler, event: Update, data: dict):
+        source = event.callback_query or event.message or event.inline_query
+        user = source.from_user if source else None
+        if not user:
+            return await handler(event, data)
+
+        user_state = self._user_state(user.id)
+        if event.inline_query:
+            return await self._latest(user_state, "inline", handler, event, data)
+
+        if event.callback_query:
+            key = ("callback", event.callback_query.data)
+        else:
+            key = ("message", event.message.text or event.message.caption)
+
+        now = time.monotonic()
+        if key == user_state.last_key and now - user_state.last_time < THROTTLE_WINDOW:
+            return await self._reject("duplicate", event)
+        if not user_state.bucket.try_acquire():
+            return await self._reject("rate_limited", event)
+        user_state.last_key, user_state.last_time = key, now
+
+        if event.callback_query and (event.callback_query.data or "").startswith(RENDER_PREFIXES):
+            return await self._latest(user_state, "render", handler, event, data)
+        self.counts["passed"] += 1
+        return await handler(event, data)
+
+    def _user_state(self, user_id: int) -> _UserState:
+        user_state = self._users.get(user_id)
+        if user_state is None:
+            user_state = self._users[user_id] = _UserState()
+            if len(self._users) > THROTTLE_MAX_USERS:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return user_state
+
+    async def _latest(self, user_state: _UserState, slot: str, handler, event: Update, data: dict):
+        """Обработка с отменой незаконченной предыдущей того же вида (перерисовка, inline-запрос)."""
+        previous = getattr(user_state, slot)
+        if previous and not previous.done():
+            previous.cancel()
+            self.counts["superseded" if slot == "render" else f"superseded_{slot}"] += 1
+
+        task = asyncio.ensure_future(handler(event, data))
+        setattr(user_state, slot, task)
+        self.counts["passed"] += 1
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # отменили только обработку (её заменило новое событие) — не ошибка
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                logger.debug("Обработка %s для %s отменена новым событием", slot, event.event.from_user.id)
+                return None
+            raise
+        finally:
+            if getattr(user_state, slot) is task:
+                setattr(user_state, slot, None)
+
+    async def _reject(self, reason: str, event: Update):
+        self.counts[reason] += 1
+        logger.debug("Событие %s отклонено: %s", event.update_id, reason)
+        if event.callback_query:
+            # гасим «часики» на кнопке, иначе клиент ждёт ответа
+            with contextlib.suppress(Exception):
+                await event.callback_query.answer("⏳ Не так быстро" if reason == "rate_limited" else None)
+        return None
+
+    def stats(self) -> dict:
+        return {"users": len(self._users), **self.counts}
@@ -0,0 +1,105 @@
+import asyncio
+import contextlib
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from analytics import query_rollup
+from city_index import city_index
+from limiter import TokenBucket
+from scheduler import scheduler
+from weather import GROUP_LIMIT, cache_expires_in, refresh_weather
+
+load_dotenv()
+
+POPULAR_REFRESH_INTERVAL = float(os.getenv("POPULAR_REFRESH_INTERVAL", "120"))
+POPULAR_WINDOW_HOURS = float(os.getenv("POPULAR_WINDOW_HOURS", "24"))
+POPULAR_TOP = int(os.getenv("POPULAR_TOP", "100"))
+# доля квоты OWM процесса (OWM_CALLS_PER_MINUTE), которую может тратить обновление
+POPULAR_QUOTA_FRACTION = float(os.getenv("POPULAR_QUOTA_FRACTION", "0.2"))
+
+
+class PopularRefresher:
+    """
+    Фоновое обновление погоды для самых запрашиваемых городов.
+    Раз в POPULAR_REFRESH_INTERVAL секунд города ранжируются по почасовым
+    агрегатам запросов (analytics.py) за последние POPULAR_WINDOW_HOURS часов, и те из первых POPULAR_TOP,
+    чья запись в кэше истечёт до следующего прохода, обновляются заранее.
+    Расход запросов ограничен своим токен-бакетом: POPULAR_QUOTA_FRACTION
+    от квоты OWM; запрос /group (до GROUP_LIMIT городов с id) — один токен.
+    """
+
+    def __init__(self, interval: float = POPULAR_REFRESH_INTERVAL, fraction: float = POPULAR_QUOTA_FRACTION):
+        self.interval = interval
+        self.fraction = fraction
+        self.budget = self._budget()
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.refreshed = 0
+        self.skipped_budget = 0
+
+    def _budget(self) -> TokenBucket:
+        # доля квоты этого процесса (см. RequestScheduler.share_quota)
+        rate = scheduler.calls_per_minute * self.fraction / 60
+        return TokenBucket(rate=rate, capacity=max(1.0, rate * self.interval))
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self.budget = self._budget()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Ошибка обновления популярных городов: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def refresh_once(self) -> int:
+        await query_rollup.process()
+        top = await query_rollup.top_cities(POPULAR_WINDOW_HOURS, POPULAR_TOP)
+        due = [city for city, _count in top if self._expires_soon(city)]
+        selected = self._within_budget(due)
+        self.runs += 1
+        if not selected:
+            return 0
+        updated = await refresh_weather(selected)
+        self.refreshed += updated
+        logging.debug("Обновлено популярных городов: %s из %s", updated, len(due))
+        return updated
+
+    def _expires_soon(self, city: str) -> bool:
+        left = cache_expires_in(city)
+        return left is None or left < self.interval * 1.5
+
+    def _within_budget(self, cities: list[str]) -> list[str]:
+        """Города в порядке популярности, пока хватает токенов на запросы."""
+        selected = []
+        grouped = 0
+        for city in cities:
+            # город с id попадает в текущий запрос /group, пока в нём есть место
+            has_id = city_index.owm_id(city) is not None
+            needs_call = not has_id or grouped % GROUP_LIMIT == 0
+            if needs_call and not self.budget.try_acquire():
+                self.skipped_budget += len(cities) - len(selected)
+                break
+            grouped += has_id
+            selected.append(city)
+        return selected
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "refreshed": self.refreshed, "skipped_budget": self.skipped_budget}
+
+
+popular_refresher = PopularRefresher()
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+from weather import warm_cache
+
+
+class PagePrefetcher:
+    """
+    Фоновая предзагрузка соседних страниц списка городов в кэш погоды.
+    На пользователя одна задача: показ новой страницы заменяет прежнюю
+    предзагрузку, выход из состояния waiting_for_cities отменяет её.
+    Запросы идут с фоновым приоритетом и не задерживают интерактивные.
+    """
+
+    def __init__(self):
+        self._tasks: dict[int, asyncio.Task] = {}
+        self.scheduled = 0
+        self.completed = 0
+        self.cancelled = 0
+        # задержка перелистывания: страница уже была в кэше (warm) или нет (cold)
+        self.warm_flips = 0
+        self.cold_flips = 0
+        self.warm_time = 0.0
+        self.cold_time = 0.0
+
+    def schedule(self, user_id: int, city_names: list[str]):
+        self.cancel(user_id)
+        if not city_names:
+            return
+        self.scheduled += 1
+        task = asyncio.create_task(self._run(city_names))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda t: self._done(user_id, t))
+
+    def cancel(self, user_id: int):
+        task = self._tasks.pop(user_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+            self.cancelled += 1
+
+    async def _run(self, city_names: list[str]):
+        try:
+            await warm_cache(city_names)
+            self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Ошибка предзагрузки страниц: {e}")
+
+    def _done(self, user_id: int, task: asyncio.Task):
+        if self._tasks.get(user_id) is task:
+            del self._tasks[user_id]
+
+    def record_flip(self, warm: bool, elapsed: float):
+        """Учёт времени получения погоды для показанной страницы."""
+        if warm:
+            self.warm_flips += 1
+            self.warm_time += elapsed
+        else:
+            self.cold_flips += 1
+            self.cold_time += elapsed
+
+    def stats(self) -> dict:
+        warm_avg = self.warm_time / self.warm_flips if self.warm_flips else 0.0
+        cold_avg = self.cold_time / self.cold_flips if self.cold_flips else 0.0
+        return {
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "active": len(self._tasks),
+            "warm_flips": self.warm_flips,
+            "cold_flips": self.cold_flips,
+            "warm_avg_ms": round(warm_avg * 1000, 1),
+            "cold_avg_ms": round(cold_avg * 1000, 1),
+            # сэкономлено на всех "тёплых" перелистываниях относительно холодных
+            "saved_ms": round((cold_avg - warm_avg) * self.warm_flips * 1000, 1) if self.cold_flips else 0.0,
+        }
+
+
+prefetcher = PagePrefetcher()
@@ -0,0 +1,137 @@
+import datetime
+import math
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from weather_model import Forecast, Weather
+
+load_dotenv()
+
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "4096"))
+
+# сектора по 45° начиная с севера; на границе сектора — меньший угол
+WIND_DIRECTIONS = (
+    "северный", "северо-восточный", "восточный", "юго-восточный",
+    "южный", "юго-западный", "западный", "северо-западный",
+)
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+# группы кодов погоды OWM: 2xx гроза, 3xx морось, 5xx дождь, 6xx снег, 7xx туман, 800 ясно, 80x облака
+CONDITION_ICONS = {2: "⛈", 3: "🌦", 5: "🌧", 6: "🌨", 7: "🌫", 8: "☁️"}
+
+
+def wind_direction(deg: float) -> str:
+    """Направление ветра по углу без перебора секторов."""
+    return WIND_DIRECTIONS[math.ceil((deg % 360 - 22.5) / 45) % 8]
+
+
+def local_time(ts: float, utc_offset: int, fmt: str = "%H:%M") -> str:
+    """Время ts в часовом поясе города (смещение utc_offset секунд)."""
+    return time.strftime(fmt, time.gmtime(ts + utc_offset)) if ts else "??:??"
+
+
+class RenderCache:
+    """
+    Готовые тексты по (вид, город, версия данных).
+    Версия — время получения данных и флаг сбоя: новый ответ OWM
+    даёт новый ключ, старые вытесняются по LRU.
+    """
+
+    def __init__(self, maxsize: int = RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, kind: str, city_name: str, data: Weather, render) -> str:
+        if not data.fetched_at:
+            return render(city_name, data)  # без времени получения версию не определить
+        key = (kind, city_name, data.fetched_at, data.outage)
+        text = self._data.get(key)
+        if text is not None:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return text
+        self.misses += 1
+        text = self._data[key] = render(city_name, data)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return text
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+render_cache = RenderCache()
+
+
+def stale_mark(data: Weather) -> str:
+    """Пометка " (данные от ЧЧ:ММ)" для данных, отданных во время сбоя OWM."""
+    if not data.outage:
+        return ""
+    return f" (данные от {local_time(data.fetched_at, data.timezone)})"
+
+
+def format_weather_label(city_name: str, data: Weather) -> str:
+    """Краткая метка "🌆 Город | t°C" для кнопки списка (дешевле поиска в кэше, не кэшируется)."""
+    if data.ok:
+        return f"🌆 {city_name} | {data.temp:g}°C{stale_mark(data)}"
+    msg = data.message or "неизвестная ошибка"
+    if msg.lower() == "city not found":
+        return f"🌆 {city_name} | (Город не найден)"
+    return f"🌆 {city_name} | (ошибка: {msg})"
+
+
+def _render_details(city_name: str, data: Weather) -> str:
+    # дата и время — местные для города, а не сервера
+    lines = [
+        f"<b>🌍 Погода в {city_name} | {local_time(data.fetched_at or time.time(), data.timezone, '%d %B %Y')}</b>",
+        "",
+        f"<b>🌡 Температура:</b> {data.temp:g}°C <i>(ощущается как {data.feels_like:g}°C)</i>",
+        f"<b>💧 Влажность:</b> {data.humidity}%",
+        f"<b>📋 Давление:</b> {data.pressure} гПа",
+        f"<b>💨 Ветер:</b> {data.wind_speed:g} м/с, {wind_direction(data.wind_deg)}",
+        f"<b>☁️ Облачность:</b> {data.clouds}%",
+        f"<b>🗒 Описание:</b> {data.description}",
+        f"<b>👀 Видимость:</b> {data.visibility / 1000} км",
+        f"<b>🌅 Восход:</b> {local_time(data.sunrise, data.timezone)} | "
+        f"<b>🌇 Закат:</b> {local_time(data.sunset, data.timezone)}",
+    ]
+    if data.outage:
+        lines.insert(1, f"<i>⚠️ Сервис погоды недоступен, данные от {local_time(data.fetched_at, data.timezone)}</i>")
+    return "\n".join(lines)
+
+
+def format_detailed_weather(city_name: str, data: Weather) -> str:
+    """Текст подробной погоды по уже полученным данным."""
+    if data.ok:
+        return render_cache.get_or_render("details", city_name, data, _render_details)
+    msg = data.message or "ошибка"
+    if msg.lower() == "city not found":
+        return f"🌍 Погода в {city_name} | Город не найден"
+    return f"Ошибка детал. погоды: {msg}"
+
+
+def condition_icon(code: int) -> str:
+    return "☀️" if code == 800 else CONDITION_ICONS.get(code // 100, "🌡")
+
+
+def format_forecast(city_name: str, forecast: Forecast) -> str:
+    """Прогноз по дням: преобладающая погода, температура и осадки."""
+    if not forecast.ok:
+        msg = forecast.message or "ошибка"
+        if msg.lower() == "city not found" or forecast.status == 404:
+            return f"📅 Прогноз в {city_name} | Город не найден"
+        return f"Ошибка прогноза: {msg}"
+    lines = [f"<b>📅 Прогноз в {city_name} на {len(forecast.days)} дн.</b>"]
+    for day in forecast.days:
+        date = datetime.date.fromisoformat(day.day)
+        precipitation = f" | 💧 {day.precipitation:g} мм" if day.precipitation else ""
+        lines += [
+            "",
+            f"<b>{WEEKDAYS[date.weekday()]}, {date:%d.%m}</b> {condition_icon(day.condition)} {day.description}",
+            f"🌡 {day.temp_min:g}…{day.temp_max:g}°C, в среднем {day.temp_mean:g}°C{precipitation}",
+        ]
+    return "\n".join(lines)
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import random
+import time
+from enum import IntEnum
+
+import aiohttp
+from dotenv import load_dotenv
+
+from limiter import PrioritySemaphore, TokenBucket
+from metrics import OWM_REQUEST_SECONDS
+from weather_model import json_loads
+
+load_dotenv()
+
+OWM_CALLS_PER_MINUTE = int(os.getenv("OWM_CALLS_PER_MINUTE", "60"))
+OWM_TIMEOUT = float(os.getenv("OWM_TIMEOUT", "10"))
+OWM_RETRIES = int(os.getenv("OWM_RETRIES", "2"))
+OWM_BACKOFF = float(os.getenv("OWM_BACKOFF", "0.5"))
+OWM_POOL_LIMIT = int(os.getenv("OWM_POOL_LIMIT", "32"))
+OWM_POOL_PER_HOST = int(os.getenv("OWM_POOL_PER_HOST", "16"))
+OWM_MAX_IN_FLIGHT = int(os.getenv("OWM_MAX_IN_FLIGHT", "16"))
+OWM_DNS_TTL = int(os.getenv("OWM_DNS_TTL", "300"))
+OWM_KEEPALIVE = float(os.getenv("OWM_KEEPALIVE", "30"))
+# столько ответов 5xx и таймаутов подряд — OWM считается недоступным (см. degraded)
+OWM_OUTAGE_FAILURES = int(os.getenv("OWM_OUTAGE_FAILURES", "3"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class Priority(IntEnum):
+    """Полосы приоритета: меньшее значение обслуживается раньше."""
+    INTERACTIVE = 0  # пользователь ждёт ответа (подробности, текущая страница)
+    NORMAL = 1  # проверка новых городов
+    BACKGROUND = 2  # предзагрузка и фоновое обновление кэша
+
+
+# дедлайн по умолчанию для всего запроса с ожиданием очереди и повторами
+DEFAULT_DEADLINES = {
+    Priority.INTERACTIVE: 15.0,
+    Priority.NORMAL: 30.0,
+    Priority.BACKGROUND: 60.0,
+}
+
+
+def _backoff(attempt: int, retry_after: str | None) -> float:
+    """Пауза перед повтором: Retry-After от сервера или экспонента с джиттером."""
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return OWM_BACKOFF * 2 ** attempt + random.uniform(0, OWM_BACKOFF)
+
+
+class RequestScheduler:
+    """
+    Планировщик исходящих запросов к OWM.
+      - одна сессия с ограниченным пулом соединений, кэшем DNS и keep-alive;
+      - токен-бакет на каждый API-ключ (квота тарифа в минуту);
+      - приоритетные полосы: свободный слот и токен первым получает
+        интерактивный запрос, фоновые занимают не больше половины слотов;
+      - дедлайн на весь запрос, таймаут и повторы на 429/5xx.
+    """
+
+    def __init__(
+        self,
+        calls_per_minute: int = OWM_CALLS_PER_MINUTE,
+        max_in_flight: int = OWM_MAX_IN_FLIGHT,
+    ):
+        self.calls_per_minute = calls_per_minute
+        self._total_calls_per_minute = calls_per_minute
+        self._session: aiohttp.ClientSession | None = None
+        self._buckets: dict[str, TokenBucket] = {}
+        self._slots = PrioritySemaphore(max_in_flight)
+        self._background = asyncio.Semaphore(max(1, max_in_flight // 2))
+        self._timeout = aiohttp.ClientTimeout(total=OWM_TIMEOUT)
+        self.requests = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+        self._failures = 0  # ответов 5xx и таймаутов подряд
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Ленивая инициализация переиспользуемой сессии."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=OWM_POOL_LIMIT,
+                limit_per_host=OWM_POOL_PER_HOST,
+                ttl_dns_cache=OWM_DNS_TTL,
+                keepalive_timeout=OWM_KEEPALIVE,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def bucket(self, api_key: str | None) -> TokenBucket:
+        """Токен-бакет квоты для API-ключа."""
+        key = api_key or ""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(
+                rate=self.calls_per_minute / 60,
+                capacity=max(1, self.calls_per_minute // 6),
+            )
+            self._buckets[key] = bucket
+        return bucket
+
+    def share_quota(self, processes: int):
+        """
+        Доля квоты на процесс, когда к OWM с тем же ключом ходят несколько
+        процессов: бакеты у каждого свои, вместе они не превышают квоту.
+        """
+        self.calls_per_minute = max(1, self._total_calls_per_minute // max(1, processes))
+        self._buckets.clear()
+
+    def degraded(self) -> bool:
+        """OWM отвечает ошибками или не отвечает: запросы подряд заканчиваются 5xx или таймаутом."""
+        return self._failures >= OWM_OUTAGE_FAILURES
+
+    def _record(self, status: int):
+        if status >= 500:
+            self._failures += 1
+        elif status != 429:  # флуд-контроль — не признак недоступности
+            self._failures = 0
+
+    def queue_depth(self) -> int:
+        return self._slots.waiting()
+
+    async def get_json(
+        self,
+        url: str,
+        params: dict,
+        api_key: str | None = None,
+        priority: Priority = Priority.NORMAL,
+        deadline: float | None = None,
+    ) -> dict:
+        """
+        GET-запрос с JSON-ответом. В ответ добавляется поле status,
+        при сетевой ошибке или истёкшем дедлайне возвращается {"status": 5xx, "message": ...}.
+        """
+        if deadline is None:
+            deadline = DEFAULT_DEADLINES[priority]
+        try:
+            async with asyncio.timeout(deadline):
+                if priority >= Priority.BACKGROUND:
+                    async with self._background:
+                        return await self._request(url, params, api_key, priority)
+                return await self._request(url, params, api_key, priority)
+        except TimeoutError:
+            self.deadline_exceeded += 1
+            self._record(504)
+            return {"status": 504, "message": "deadline exceeded"}
+
+    async def _request(self, url: str, params: dict, api_key: str | None, priority: Priority) -> dict:
+        session = await self.get_session()
+        bucket = self.bucket(api_key)
+        await self._slots.acquire(priority)
+        try:
+            for attempt in range(OWM_RETRIES + 1):
+                await bucket.acquire(priority=priority)
+                self.requests += 1
+                retry_after = None
+                started = time.perf_counter()
+                try:
+                    async with session.get(url, params=params) as response:
+                        retry_after = response.headers.get("Retry-After")
+                        data = await response.json(loads=json_loads)
+                        data["status"] = response.status
+                except Exception as e:
+                    data = {"status": 500, "message": str(e) or type(e).__name__}
+                OWM_REQUEST_SECONDS.labels(data["status"]).observe(time.perf_counter() - started)
+                self._record(data["status"])
+                if data["status"] not in RETRY_STATUSES or attempt == OWM_RETRIES:
+                    return data
+                self.retries += 1
+                await asyncio.sleep(_backoff(attempt, retry_after))
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "deadline_exceeded": self.deadline_exceeded,
+            "degraded": self.degraded(),
+            "queued": self.queue_depth(),
+        }
+
+
+scheduler = RequestScheduler()
@@ -2,3 +2,8 @@ from aiogram.fsm.state import State, StatesGroup
 
 class States(StatesGroup):
     waiting_for_cities = State()
+
+
+class SubscribeStates(StatesGroup):
+    waiting_for_city = State()
+    waiting_for_time = State()
@@ -0,0 +1,3 @@
+def normalize_city(name: str) -> str:
+    """Нормализация названия города: регистр, ё/е и лишние пробелы."""
+    return " ".join(name.casefold().replace("ё", "е").split())
@@ -1,59 +1,272 @@
 import asyncio
+import logging
 import os
-import aiohttp
+import time
 from dotenv import load_dotenv
-from datetime import datetime
+from city_index import city_index
+from scheduler import Priority, scheduler
+from utils import normalize_city
+from weather_cache import WeatherCache
+from weather_model import Weather
+from render import format_detailed_weather, format_weather_label
+from weather_store import weather_store
 
 load_dotenv()
 
 OWM_API_KEY = os.getenv("OWM_API_KEY")
-BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
+OWM_BASE_URL = os.getenv("OWM_BASE_URL", "https://api.openweathermap.org/data/2.5")
+BASE_URL = f"{OWM_BASE_URL}/weather"
+GROUP_URL = f"{OWM_BASE_URL}/group"
+GROUP_LIMIT = 20  # максимум id в одном запросе /group
+UNITS = "metric"
+LANG = "ru"
 
-# глобальная сессия для переиспользования
-_session = None
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "2048"))
+# сколько после истечения TTL данные с диска отдаются сразу, обновляясь в фоне
+WEATHER_STALE_WINDOW = int(os.getenv("WEATHER_STALE_WINDOW", "3600"))
 
-async def get_session():
-    """Ленивая инициализация переиспользуемой сессии."""
-    global _session
-    if _session is None or _session.closed:
-        _session = aiohttp.ClientSession()
-    return _session
+# общий кэш ответов: ключ (нормализованный город, units, lang)
+weather_cache = WeatherCache(ttl=WEATHER_CACHE_TTL, maxsize=WEATHER_CACHE_SIZE)
+
+# ссылки на фоновые задачи обновления, чтобы их не собрал GC
+_background_tasks: set = set()
+# ключи, которые сейчас обновляются в фоне
+_refreshing: set = set()
+# ключи, чьё последнее обновление не удалось: запись с диска показывается с пометкой
+_refresh_failed: set = set()
 
 async def close_session():
     """Закрытие сессии при завершении работы."""
-    global _session
-    if _session and not _session.closed:
-        await _session.close()
+    await scheduler.close()
 
-async def fetch_weather_data(city_name: str, session: aiohttp.ClientSession) -> dict:
-    """Базовая функция для получения данных о погоде."""
+async def fetch_weather_data(city_name: str, priority: Priority = Priority.INTERACTIVE) -> Weather:
+    """Базовая функция для получения данных о погоде (через общий планировщик запросов)."""
     params = {
         "q": city_name,
         "appid": OWM_API_KEY,
-        "units": "metric",
-        "lang": "ru"
+        "units": UNITS,
+        "lang": LANG
+    }
+    data = await scheduler.get_json(BASE_URL, params, api_key=OWM_API_KEY, priority=priority)
+    return Weather.from_owm(data, data["status"])
+
+async def fetch_weather_group(owm_ids: list[int], priority: Priority = Priority.INTERACTIVE) -> dict[int, Weather]:
+    """
+    Погода для нескольких городов одним запросом /group (не больше GROUP_LIMIT id).
+    Если запрос не удался, каждому id достаётся ошибка; id, которых нет
+    в успешном ответе, в результат не попадают.
+    """
+    params = {
+        "id": ",".join(map(str, owm_ids)),
+        "appid": OWM_API_KEY,
+        "units": UNITS,
+        "lang": LANG
     }
+    data = await scheduler.get_json(GROUP_URL, params, api_key=OWM_API_KEY, priority=priority)
+    if data["status"] != 200:
+        # 429, 5xx, дедлайн: поштучные запросы по тем же городам только добавят нагрузки
+        error = Weather.from_owm(data, data["status"])
+        return {owm_id: error for owm_id in owm_ids}
+    result = {}
+    for item in data.get("list", []):
+        result[item["id"]] = Weather.from_owm(item, 200)
+    return result
+
+def _cache_key(city_name: str) -> tuple:
+    return (normalize_city(city_name), UNITS, LANG)
+
+def _is_cacheable(data: Weather) -> bool:
+    # кэшируем успешные ответы и "город не найден"; ошибки сети и устаревшие данные — нет
+    return data.status in (200, 404) and not data.stale
+
+def _ttl_for(data: Weather) -> float:
+    """Оставшееся время жизни: данные с диска могли быть получены раньше."""
+    if not data.fetched_at:
+        return WEATHER_CACHE_TTL
+    return max(1.0, WEATHER_CACHE_TTL - (time.time() - data.fetched_at))
+
+def _mark_stale(data: Weather, outage: bool = False) -> Weather:
+    """Копия устаревшей записи; outage — OWM недоступен, пользователю показывается пометка."""
+    return data.marked(stale=True, outage=outage)
+
+async def get_weather(city_name: str, priority: Priority = Priority.INTERACTIVE) -> Weather:
+    """Данные о погоде через общий кэш с объединением одновременных запросов."""
+    return (await get_weather_many([city_name], priority))[0]
+
+async def _fetch_live(names: dict, priority: Priority) -> dict:
+    """
+    Запрос погоды у OWM: города с известным id в OWM — пачками
+    через /group, остальные (и те, которых нет в успешном ответе /group) — поштучно.
+    """
+    keys_by_id = {}
+    for key, city in names.items():
+        owm_id = city_index.owm_id(city)
+        if owm_id:
+            keys_by_id.setdefault(owm_id, []).append(key)
+
+    ids = list(keys_by_id)
+    chunks = [ids[i:i + GROUP_LIMIT] for i in range(0, len(ids), GROUP_LIMIT)]
+    groups = await asyncio.gather(*(fetch_weather_group(chunk, priority) for chunk in chunks))
+
+    results = {}
+    for group in groups:
+        for owm_id, item in group.items():
+            for key in keys_by_id.get(owm_id, ()):
+                results[key] = item
+
+    rest = [key for key in names if key not in results]
+    singles = await asyncio.gather(*(fetch_weather_data(names[key], priority) for key in rest))
+    results.update(zip(rest, singles))
+
+    now = time.time()
+    fresh = {}
+    for key, data in results.items():
+        if data.ok:
+            results[key] = fresh[key] = data.with_fetched_at(now)
+    if fresh:
+        _spawn(weather_store.save(fresh))
+    return results
+
+async def _load_many(names: dict, priority: Priority) -> dict:
+    """
+    Загрузка промахов памяти через хранилище на диске (stale-while-revalidate):
+      - свежая запись отдаётся без запроса к OWM;
+      - устаревшая не больше чем на WEATHER_STALE_WINDOW — сразу, с обновлением в фоне;
+        если прошлое фоновое обновление не удалось — с пометкой "данные от ЧЧ:ММ";
+      - пока OWM недоступен (scheduler.degraded), любая запись с диска отдаётся
+        сразу с пометкой, без ожидания дедлайна; фоновое обновление проверяет,
+        не вернулся ли OWM;
+      - остальные запрашиваются у OWM, а если он недоступен — отдаётся
+        последняя запись с пометкой.
+    """
+    stored = await weather_store.load(list(names))
+    now = time.time()
+    degraded = scheduler.degraded()
+    results = {}
+    live = {}
+    refresh = {}
+    for key, city in names.items():
+        payload = stored.get(key)
+        age = now - payload.fetched_at if payload else None
+        if age is not None and age < WEATHER_CACHE_TTL:
+            results[key] = payload
+        elif age is not None and (degraded or age < WEATHER_CACHE_TTL + WEATHER_STALE_WINDOW):
+            results[key] = _mark_stale(payload, outage=degraded or key in _refresh_failed)
+            if key not in _refreshing:
+                refresh[key] = city
+        else:
+            live[key] = city
+
+    if refresh:
+        _refreshing.update(refresh)
+        _spawn(_refresh(refresh))
+
+    if live:
+        fetched = await _fetch_live(live, priority)
+        for key, data in fetched.items():
+            if data.status not in (200, 404) and key in stored:
+                data = _mark_stale(stored[key], outage=True)
+            elif data.ok:
+                _refresh_failed.discard(key)
+            results[key] = data
+    return results
+
+async def _refresh(names: dict):
+    """Фоновое обновление устаревших записей."""
     try:
-        async with session.get(BASE_URL, params=params) as response:
-            data = await response.json()
-            data["status"] = response.status
-            return data
-    except Exception as e:
-        return {"status": 500, "message": str(e)}
+        fetched = await _fetch_live(names, Priority.BACKGROUND)
+        for key, data in fetched.items():
+            if _is_cacheable(data):
+                weather_cache.set(key, data, _ttl_for(data))
+                _refresh_failed.discard(key)
+            else:
+                _refresh_failed.add(key)
+    finally:
+        _refreshing.difference_update(names)
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+def _background_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logging.warning(f"Ошибка фонового обновления погоды: {task.exception()}")
+
+async def get_weather_many(city_names: list[str], priority: Priority = Priority.INTERACTIVE) -> list[Weather]:
+    """Погода для списка городов через кэш с пакетной загрузкой промахов."""
+    names = {}
+    for city in city_names:
+        names.setdefault(_cache_key(city), city)
+    return await weather_cache.get_or_load_many(
+        [_cache_key(city) for city in city_names],
+        lambda missing: _load_many({key: names[key] for key in missing}, priority),
+        cacheable=_is_cacheable,
+        ttl_for=_ttl_for,
+        # фоновую загрузку, которую никто больше не ждёт, незачем продолжать
+        abandon=priority >= Priority.BACKGROUND,
+    )
+
+def is_cached(city_names: list[str]) -> bool:
+    """Есть ли свежие данные в кэше для всех городов списка."""
+    return all(weather_cache.get(_cache_key(city)) is not None for city in city_names)
+
+async def warm_cache(city_names: list[str]):
+    """Фоновая загрузка погоды в кэш (для предзагрузки страниц)."""
+    await get_weather_many(city_names, Priority.BACKGROUND)
+
+def cached_weather(city_name: str) -> Weather | None:
+    """Свежие данные из кэша в памяти, без обращения к диску и OWM."""
+    return weather_cache.get(_cache_key(city_name))
+
+def cache_expires_in(city_name: str) -> float | None:
+    """Сколько секунд осталось жить записи города в кэше, None — записи нет."""
+    return weather_cache.expires_in(_cache_key(city_name))
+
+async def refresh_weather(city_names: list[str]) -> int:
+    """
+    Принудительное фоновое обновление кэша для городов (даже если запись
+    ещё свежая). Возвращает число успешно обновлённых городов.
+    """
+    names = {_cache_key(city): city for city in city_names}
+    names = {key: city for key, city in names.items() if key not in _refreshing}
+    if not names:
+        return 0
+    _refreshing.update(names)
+    try:
+        fetched = await _fetch_live(names, Priority.BACKGROUND)
+    finally:
+        _refreshing.difference_update(names)
+    updated = 0
+    for key, data in fetched.items():
+        if _is_cacheable(data):
+            weather_cache.set(key, data, _ttl_for(data))
+            _refresh_failed.discard(key)
+            updated += data.ok
+    return updated
+
+def get_cache_stats() -> dict:
+    """Счётчики попаданий/промахов/объединённых запросов кэша погоды."""
+    return weather_cache.stats()
 
 async def check_city_exists(city_name: str) -> tuple[bool, str]:
     """Проверка существования города."""
-    session = await get_session()
-    data = await fetch_weather_data(city_name, session)
-
-    if data["status"] == 200:
-        temp = data["main"]["temp"]
-        return True, f"🌆 {city_name} | {temp}°C"
-    else:
-        msg = data.get("message", "неизвестная ошибка")
-        if msg.lower() == "city not found":
-            return False, f"🌆 {city_name} | (Город не найден)"
-        return False, f"🌆 {city_name} | (ошибка: {msg})"
+    data = await get_weather(city_name)
+    return data.ok, format_weather_label(city_name, data)
+
+async def resolve_city(city_name: str) -> tuple[str, int | None] | None:
+    """(официальное название, id в OWM) по данным OWM или None, если город не найден."""
+    data = await get_weather(city_name, Priority.NORMAL)
+    if data.ok:
+        return data.name or city_name, data.id
+    return None
+
+async def resolve_cities(city_names: list[str]) -> dict[str, tuple[str, int | None] | None]:
+    """Одновременная проверка списка городов (квоту OWM соблюдает планировщик)."""
+    results = await asyncio.gather(*(resolve_city(city) for city in city_names))
+    return dict(zip(city_names, results))
 
 async def get_weather_label(city_name: str) -> str:
     """Получение краткой метки погоды."""
@@ -62,85 +275,10 @@ async def get_weather_label(city_name: str) -> str:
 
 async def get_weather_label_parallel(city_names: list[str]) -> list[str]:
     """Параллельное получение меток для списка городов."""
-    session = await get_session()
-    tasks = [fetch_weather_data(city, session) for city in city_names]
-    results = await asyncio.gather(*tasks)
-
-    labels = []
-    for city, data in zip(city_names, results):
-        if data["status"] == 200:
-            temp = data["main"]["temp"]
-            labels.append(f"🌆 {city} | {temp}°C")
-        else:
-            msg = data.get("message", "неизвестная ошибка")
-            if msg.lower() == "city not found":
-                labels.append(f"🌆 {city} | (Город не найден)")
-            else:
-                labels.append(f"🌆 {city} | (ошибка: {msg})")
-    return labels
+    results = await get_weather_many(city_names)
+    return [format_weather_label(city, data) for city, data in zip(city_names, results)]
 
 async def get_detailed_weather(city_name: str) -> str:
     """Получение подробной информации о погоде (асинхронно)."""
-    session = await get_session()
-    data = await fetch_weather_data(city_name, session)
-
-    if data["status"] != 200:
-        msg = data.get("message", "ошибка")
-        if msg.lower() == "city not found":
-            return f"🌍 Погода в {city_name} | Город не найден"
-        return f"Ошибка детал. погоды: {msg}"
-
-    main = data.get("main", {})
-    wind = data.get("wind", {})
-    clouds = data.get("clouds", {})
-    sys_data = data.get("sys", {})
-    weather = data.get("weather", [{}])[0]
-    visibility = data.get("visibility", 0)
-
-    temp = main.get("temp")
-    feels_like = main.get("feels_like")
-    humidity = main.get("humidity")
-    pressure = main.get("pressure")
-    wind_speed = wind.get("speed")
-    wind_deg = wind.get("deg", 0)
-    cloudiness = clouds.get("all", 0)
-    sunrise_ts = sys_data.get("sunrise")
-    sunset_ts = sys_data.get("sunset")
-    desc = weather.get("description", "")
-    vis_km = visibility / 1000
-
-    now_date = datetime.now().strftime("%d %B %Y")
-
-    def fmt_time(ts):
-        return datetime.fromtimestamp(ts).strftime("%H:%M") if ts else "??:??"
-
-    sunrise_str = fmt_time(sunrise_ts)
-    sunset_str = fmt_time(sunset_ts)
-    direction = get_wind_direction(wind_deg)
-
-    lines = [
-        f"<b>🌍 Погода в {city_name} | {now_date}</b>",
-        "",
-        f"<b>🌡 Температура:</b> {temp}°C <i>(ощущается как {feels_like}°C)</i>",
-        f"<b>💧 Влажность:</b> {humidity}%",
-        f"<b>📋 Давление:</b> {pressure} гПа",
-        f"<b>💨 Ветер:</b> {wind_speed} м/с, {direction}",
-        f"<b>☁️ Облачность:</b> {cloudiness}%",
-        f"<b>🗒 Описание:</b> {desc}",
-        f"<b>👀 Видимость:</b> {vis_km} км",
-        f"<b>🌅 Восход:</b> {sunrise_str} | <b>🌇 Закат:</b> {sunset_str}",
-    ]
-    return "\n".join(lines)
-
-
-
-
-def get_wind_direction(deg: float) -> str:
-    """Определение направления ветра (синхронная функция)."""
-    dirs = [
-        (0, 'северный'), (45, 'северо-восточный'), (90, 'восточный'),
-        (135, 'юго-восточный'), (180, 'южный'), (225, 'юго-западный'),
-        (270, 'западный'), (315, 'северо-западный'), (360, 'северный')
-    ]
-    closest = min(dirs, key=lambda x: abs(x[0] - deg))
-    return closest[1]
\ No newline at end of file
+    data = await get_weather(city_name)
+    return format_detailed_weather(city_name, data)
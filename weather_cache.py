@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class WeatherCache:
+    """
+    Общий кэш ответов OWM внутри процесса.
+      - записи живут ttl секунд;
+      - размер ограничен maxsize, вытесняются давно не использованные (LRU);
+      - одновременные промахи по одному ключу ждут один и тот же запрос (single-flight);
+      - отмена ожидающего не отменяет общую загрузку, кроме пакетов
+        с abandon=True (фоновая предзагрузка): такой пакет отменяется,
+        когда его перестал ждать последний вызов.
+    """
+
+    def __init__(self, ttl: float = 600, maxsize: int = 2048):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._inflight: dict = {}  # key -> asyncio.Task
+        self._batch_of: dict = {}  # key -> пакетная загрузка, в которую входит ключ
+        self._waiters: dict = {}  # пакетная загрузка -> число ожидающих вызовов
+        self._abandonable: set = set()  # пакеты, которые можно отменить без ожидающих
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        """Значение из кэша или None, если записи нет или она устарела."""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def expires_in(self, key) -> float | None:
+        """Сколько секунд осталось жить записи, None — записи нет."""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        return max(0.0, item[0] - time.monotonic())
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_load(self, key, loader, cacheable=None):
+        """
+        Возвращает значение по ключу, при промахе вызывает loader().
+        Результат кладётся в кэш, только если cacheable(value) истинно.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader, cacheable))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+            self._abandonable.discard(self._batch_of.get(key))
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader, cacheable):
+        try:
+            value = await loader()
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_load_many(self, keys: list, loader, cacheable=None, ttl_for=None, abandon: bool = False) -> list:
+        """
+        Пакетный вариант get_or_load: все промахи загружаются одним вызовом
+        loader(missing_keys) -> {key: value}, уже идущие загрузки переиспользуются.
+        ttl_for(value) задаёт время жизни записи, если оно отличается от ttl.
+        abandon=True — результат нужен только этому вызову и ему подобным:
+        пакет отменяется, если все ожидающие его вызовы отменены.
+        """
+        results = {}
+        waits = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                results[key] = value
+            elif key in self._inflight:
+                self.coalesced += 1
+                waits[key] = self._inflight[key]
+            else:
+                self.misses += 1
+                missing.append(key)
+
+        batches = {self._batch_of[key] for key in waits if key in self._batch_of}
+        if not abandon:
+            # результат ждёт и тот, кто не готов его бросить
+            self._abandonable.difference_update(batches)
+        if missing:
+            batch = asyncio.ensure_future(self._load_batch(missing, loader, cacheable, ttl_for))
+            batch.add_done_callback(self._forget_batch)
+            if abandon:
+                self._abandonable.add(batch)
+            batches.add(batch)
+            for key in missing:
+                task = asyncio.ensure_future(self._pick(key, batch))
+                self._inflight[key] = task
+                self._batch_of[key] = batch
+                waits[key] = task
+
+        for batch in batches:
+            self._waiters[batch] = self._waiters.get(batch, 0) + 1
+        try:
+            for key, task in waits.items():
+                results[key] = await asyncio.shield(task)
+        finally:
+            for batch in batches:
+                self._leave(batch)
+        return [results[key] for key in keys]
+
+    def _leave(self, batch: asyncio.Future):
+        left = self._waiters.get(batch, 0) - 1
+        if left > 0:
+            self._waiters[batch] = left
+            return
+        self._waiters.pop(batch, None)
+        if batch in self._abandonable and not batch.done():
+            # ключи отменяемого пакета освобождаются сразу: следующий вызов
+            # начнёт новую загрузку, а не присоединится к отменённой
+            for key in [key for key, owner in self._batch_of.items() if owner is batch]:
+                del self._batch_of[key]
+                self._inflight.pop(key, None)
+            batch.cancel()
+
+    def _forget_batch(self, batch: asyncio.Future):
+        self._waiters.pop(batch, None)
+        self._abandonable.discard(batch)
+
+    async def _load_batch(self, keys: list, loader, cacheable, ttl_for) -> dict:
+        values = await loader(keys)
+        for key, value in values.items():
+            if cacheable is None or cacheable(value):
+                self.set(key, value, ttl_for(value) if ttl_for else None)
+        return values
+
+    async def _pick(self, key, batch: asyncio.Future):
+        try:
+            values = await batch
+            return values[key]
+        finally:
+            # ключ мог уже перейти к новой загрузке
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+            if self._batch_of.get(key) is batch:
+                del self._batch_of[key]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,152 @@
+import json
+import struct
+from dataclasses import dataclass, replace
+
+try:  # orjson — необязательная зависимость, разбирает ответы OWM в несколько раз быстрее
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# status, id, timezone, humidity, pressure, wind_deg, clouds, visibility, sunrise, sunset,
+# temp, feels_like, wind_speed, fetched_at, флаги, длины name / description / message
+_HEADER = struct.Struct("<HiiHHHBIIIddddBHHH")
+_STALE = 1
+_OUTAGE = 2
+
+
+@dataclass(slots=True)
+class Weather:
+    """
+    Погода по городу: только поля, которые показывает бот.
+    Создаётся один раз из ответа OWM (from_owm), дальше хранится в кэше
+    и на диске в компактном бинарном виде (to_bytes / from_bytes).
+    Экземпляр общий для всех читателей кэша и не изменяется:
+    изменённые копии — через marked() и with_fetched_at().
+    """
+    status: int
+    message: str = ""
+    name: str = ""
+    id: int | None = None
+    temp: float = 0.0
+    feels_like: float = 0.0
+    humidity: int = 0
+    pressure: int = 0
+    wind_speed: float = 0.0
+    wind_deg: int = 0
+    clouds: int = 0
+    description: str = ""
+    visibility: int = 0
+    sunrise: int = 0
+    sunset: int = 0
+    timezone: int = 0  # смещение от UTC, секунды
+    fetched_at: float = 0.0
+    stale: bool = False
+    outage: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+    @classmethod
+    def from_owm(cls, data: dict, status: int | None = None) -> "Weather":
+        """Разбор ответа OWM (/weather или элемента списка /group)."""
+        status = data.get("status", 200) if status is None else status
+        if status != 200:
+            return cls(status=status, message=str(data.get("message", "")))
+        main = data.get("main", {})
+        wind = data.get("wind", {})
+        sys_data = data.get("sys", {})
+        weather = (data.get("weather") or [{}])[0]
+        return cls(
+            status=200,
+            name=data.get("name", ""),
+            id=data.get("id"),
+            temp=float(main.get("temp", 0.0)),
+            feels_like=float(main.get("feels_like", 0.0)),
+            humidity=int(main.get("humidity", 0)),
+            pressure=int(main.get("pressure", 0)),
+            wind_speed=float(wind.get("speed", 0.0)),
+            wind_deg=int(wind.get("deg", 0)),
+            clouds=int(data.get("clouds", {}).get("all", 0)),
+            description=weather.get("description", ""),
+            visibility=int(data.get("visibility", 0)),
+            sunrise=int(sys_data.get("sunrise", 0)),
+            sunset=int(sys_data.get("sunset", 0)),
+            # у элементов /group смещение лежит в sys.timezone
+            timezone=int(data.get("timezone", sys_data.get("timezone", 0))),
+            fetched_at=float(data.get("fetched_at", 0.0)),
+        )
+
+    def marked(self, stale: bool = True, outage: bool = False) -> "Weather":
+        return replace(self, stale=stale, outage=outage)
+
+    def with_fetched_at(self, fetched_at: float) -> "Weather":
+        return replace(self, fetched_at=fetched_at)
+
+    def to_bytes(self) -> bytes:
+        name = self.name.encode()
+        description = self.description.encode()
+        message = self.message.encode()
+        flags = (_STALE if self.stale else 0) | (_OUTAGE if self.outage else 0)
+        header = _HEADER.pack(
+            self.status, self.id or 0, self.timezone, self.humidity, self.pressure, self.wind_deg,
+            self.clouds, self.visibility, self.sunrise, self.sunset, self.temp, self.feels_like,
+            self.wind_speed, self.fetched_at, flags, len(name), len(description), len(message),
+        )
+        return header + name + description + message
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "Weather":
+        (
+            status, owm_id, tz, humidity, pressure, wind_deg, clouds, visibility, sunrise, sunset,
+            temp, feels_like, wind_speed, fetched_at, flags, name_len, desc_len, msg_len,
+        ) = _HEADER.unpack_from(blob)
+        pos = _HEADER.size
+        name = blob[pos:pos + name_len].decode()
+        pos += name_len
+        description = blob[pos:pos + desc_len].decode()
+        pos += desc_len
+        message = blob[pos:pos + msg_len].decode()
+        return cls(
+            status=status, message=message, name=name, id=owm_id or None, temp=temp,
+            feels_like=feels_like, humidity=humidity, pressure=pressure, wind_speed=wind_speed,
+            wind_deg=wind_deg, clouds=clouds, description=description, visibility=visibility,
+            sunrise=sunrise, sunset=sunset, timezone=tz, fetched_at=fetched_at,
+            stale=bool(flags & _STALE), outage=bool(flags & _OUTAGE),
+        )
+
+    @classmethod
+    def load(cls, payload: bytes | str) -> "Weather":
+        """Запись из weather_payloads: бинарная или JSON старого формата."""
+        if isinstance(payload, str):
+            return cls.from_owm(json.loads(payload))
+        return cls.from_bytes(payload)
+
+
+@dataclass(slots=True)
+class DayForecast:
+    day: str  # местная дата города, ГГГГ-ММ-ДД
+    temp_min: float
+    temp_max: float
+    temp_mean: float
+    precipitation: float  # дождь + снег за сутки, мм
+    condition: int  # преобладающий код погоды OWM
+    description: str
+
+
+@dataclass(slots=True)
+class Forecast:
+    """Прогноз по дням из ответа /forecast (5 дней с шагом 3 часа)."""
+    status: int
+    message: str = ""
+    name: str = ""
+    timezone: int = 0
+    days: tuple[DayForecast, ...] = ()
+    expires_at: float = 0.0  # время следующего шага прогноза, unix
+    fetched_at: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import time
+
+from database import run_db
+from weather_model import Weather
+
+WEATHER_STORE_MAX_AGE = int(os.getenv("WEATHER_STORE_MAX_AGE", str(2 * 24 * 3600)))
+
+SQL_STORE_SELECT = "SELECT city_key, payload FROM weather_payloads WHERE city_key IN ({})"
+SQL_STORE_UPSERT = "INSERT OR REPLACE INTO weather_payloads (city_key, payload, fetched_at) VALUES (?, ?, ?)"
+SQL_STORE_PRUNE = "DELETE FROM weather_payloads WHERE fetched_at < ?"
+
+CHUNK = 500  # не упираемся в лимит параметров SQLite
+
+
+def _store_key(key: tuple) -> str:
+    return "|".join(key)
+
+
+def _select(conn: sqlite3.Connection, keys: list[str]) -> dict:
+    result = {}
+    for i in range(0, len(keys), CHUNK):
+        chunk = keys[i:i + CHUNK]
+        sql = SQL_STORE_SELECT.format(",".join("?" * len(chunk)))
+        for city_key, payload in conn.execute(sql, chunk):
+            result[city_key] = Weather.load(payload)
+    return result
+
+
+def _upsert(conn: sqlite3.Connection, rows: list):
+    with conn:
+        conn.executemany(SQL_STORE_UPSERT, rows)
+
+
+def _prune(conn: sqlite3.Connection, older_than: float) -> int:
+    with conn:
+        return conn.execute(SQL_STORE_PRUNE, (older_than,)).rowcount
+
+
+class WeatherStore:
+    """
+    Последний удачный ответ OWM по каждому городу на диске (таблица weather_payloads).
+    Переживает перезапуск бота и сбои API: из него отдаются свежие данные
+    без запроса, устаревшие — пока идёт фоновое обновление.
+    """
+
+    async def load(self, keys: list[tuple]) -> dict:
+        """{ключ кэша: payload} для найденных в хранилище городов."""
+        by_store_key = {_store_key(key): key for key in keys}
+        rows = await run_db(_select, list(by_store_key))
+        return {by_store_key[city_key]: payload for city_key, payload in rows.items()}
+
+    async def save(self, items: dict):
+        """Сохранение успешных ответов {ключ кэша: Weather} в компактном бинарном виде."""
+        rows = [
+            (_store_key(key), payload.to_bytes(), payload.fetched_at)
+            for key, payload in items.items()
+        ]
+        if rows:
+            await run_db(_upsert, rows)
+
+    async def prune(self, max_age: float = WEATHER_STORE_MAX_AGE) -> int:
+        """Удаление записей старше max_age секунд."""
+        return await run_db(_prune, time.time() - max_age)
+
+
+weather_store = WeatherStore()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from dotenv import load_dotenv
+
+from logging_setup import setup_logging
+import metrics
+
+load_dotenv()
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+# 0 — отвечать Telegram после обработки (удобно для замера задержки обработчиков)
+WEBHOOK_BACKGROUND = os.getenv("WEBHOOK_BACKGROUND", "1") != "0"
+
+_worker = 0  # номер текущего процесса вебхука
+_workers = 1  # всего процессов, обслуживающих бота
+
+
+def is_primary_worker() -> bool:
+    """Единственный или первый процесс: в нём работают фоновые задачи в одном экземпляре."""
+    return _worker == 0
+
+
+def worker_count() -> int:
+    return _workers
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик вебхука с ограничением одновременно обрабатываемых обновлений.
+    Сверх max_pending ожидающих (фоновых задач и запросов, обрабатываемых
+    до ответа) отвечает 503: Telegram повторит доставку позже.
+    """
+
+    def __init__(self, *args: Any, max_concurrency: int, max_pending: int, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_pending = max_pending
+        self.rejected = 0
+        self._pending = 0  # запросы, на которые ещё не отправлен ответ
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if len(self._background_feed_update_tasks) + self._pending >= self.max_pending:
+            self.rejected += 1
+            return web.Response(status=503, text="Overloaded")
+        self._pending += 1
+        try:
+            return await super().handle(request)
+        finally:
+            self._pending -= 1
+
+    async def _background_feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        async with self._semaphore:
+            await super()._background_feed_update(bot, update)
+
+    async def _handle_request(self, bot: Bot, request: web.Request) -> web.Response:
+        async with self._semaphore:
+            return await super()._handle_request(bot, request)
+
+
+async def _set_webhook(bot: Bot):
+    await bot.set_webhook(
+        url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        drop_pending_updates=True,
+    )
+    await bot.session.close()
+    logging.info("Вебхук установлен: %s%s", WEBHOOK_URL, WEBHOOK_PATH)
+
+
+def _serve(dp: Dispatcher, bot: Bot, reuse_port: bool, index: int = 0):
+    global _worker
+    _worker = index
+    metrics.set_worker(index)  # у каждого процесса свой порт /metrics
+    # поток QueueListener не переживает fork — в дочернем процессе запускаем свой
+    log_listener = setup_logging() if multiprocessing.parent_process() else None
+    app = web.Application()
+    LimitedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=WEBHOOK_BACKGROUND,
+        max_concurrency=WEBHOOK_MAX_CONCURRENCY,
+        max_pending=WEBHOOK_MAX_PENDING,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT, reuse_port=reuse_port, access_log=None, print=None)
+    if log_listener:
+        log_listener.stop()
+
+
+def run_webhook(dp: Dispatcher, bot: Bot, set_webhook: bool = True):
+    """
+    Запуск бота в режиме вебхука на aiohttp.
+    При WEBHOOK_WORKERS > 1 поднимается несколько процессов на одном порту
+    (SO_REUSEPORT, только Linux); вебхук регистрируется один раз в родителе.
+    Фоновые задачи в одном экземпляре запускает только процесс 0
+    (is_primary_worker), квота OWM делится между процессами (worker_count).
+    """
+    global _workers
+    if not WEBHOOK_SECRET:
+        # без секрета обновления может прислать кто угодно, знающий адрес
+        logging.error("WEBHOOK_SECRET не задан, режим вебхука не запущен")
+        raise SystemExit("ошибка: для BOT_MODE=webhook нужен WEBHOOK_SECRET")
+    if set_webhook and WEBHOOK_URL:
+        asyncio.run(_set_webhook(bot))
+
+    if WEBHOOK_WORKERS <= 1:
+        _serve(dp, bot, reuse_port=False)
+        return
+
+    _workers = WEBHOOK_WORKERS
+    # fork: дочерние процессы получают уже настроенные dp и bot
+    ctx = multiprocessing.get_context("fork")
+    workers = [
+        ctx.Process(target=_serve, args=(dp, bot, True, i), name=f"webhook-{i}")
+        for i in range(WEBHOOK_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    logging.info("Запущено %s процессов вебхука на порту %s", len(workers), WEBHOOK_PORT)
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()